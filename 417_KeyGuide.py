@@ -5,28 +5,44 @@ import time
 import math
 import logging
 import traceback
+import functools
+import itertools
+import collections
+import struct
+import mmap
+import threading
+import queue
+import argparse
+import enum
+import select
+import multiprocessing
+from multiprocessing import shared_memory, connection as mp_connection
 from pathlib import Path
 
 # --- High DPI対応 & Qtログ抑制 ---
 os.environ["QT_AUTO_SCREEN_SCALE_FACTOR"] = "1"
 os.environ["QT_LOGGING_RULES"] = "qt.text.font.db=false"
+if "--benchmark" in sys.argv:
+    # ベンチマークは画面・実際の入力フックを使わずに実行する
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    os.environ.setdefault("PYNPUT_BACKEND", "dummy")
 
 from PyQt6.QtWidgets import (QApplication, QWidget, QLabel, QVBoxLayout, QHBoxLayout,
                              QSystemTrayIcon, QMenu, QDialog, QFormLayout, 
                              QSpinBox, QCheckBox, QColorDialog, QPushButton, 
                              QTabWidget, QFrame, QStyle, QFontDialog, QDoubleSpinBox,
                              QTextEdit, QMessageBox, QGraphicsDropShadowEffect,
-                             QFileDialog, QGraphicsOpacityEffect, QComboBox, QSizePolicy,
+                             QFileDialog, QComboBox, QSizePolicy,
                              QGroupBox, QListWidget, QListWidgetItem, QAbstractItemView,
                              QScrollArea, QLineEdit, QGridLayout, QTreeWidget, QTreeWidgetItem,
                              QHeaderView, QKeySequenceEdit, QButtonGroup, QSpacerItem,
                              QTreeWidgetItemIterator, QTableWidget, QTableWidgetItem,
                              QSlider, QSizeGrip, QStyledItemDelegate, QStyleOptionViewItem,
-                             QStyleOptionButton)
-from PyQt6.QtCore import (Qt, QTimer, pyqtSignal, QObject, QPoint, QRect, QSize, QEvent, 
-                          pyqtSlot, QStandardPaths, QLibraryInfo, QSharedMemory)
+                             QStyleOptionButton, QLayout)
+from PyQt6.QtCore import (Qt, QTimer, pyqtSignal, QObject, QPoint, QPointF, QRect, QRectF, QSize, QEvent, 
+                          pyqtSlot, QStandardPaths, QLibraryInfo, QSharedMemory, QEventLoop, qInstallMessageHandler)
 from PyQt6.QtGui import (QPainter, QColor, QAction, QCursor, QFont, QPainterPath, QIcon,
-                         QPolygon, QFontDatabase, QPixmap, QPen, QFontMetrics, QKeySequence, QShortcut, QLinearGradient)
+                         QPolygon, QFontDatabase, QPixmap, QRegion, QPen, QFontMetrics, QKeySequence, QShortcut, QLinearGradient)
 from PyQt6.QtNetwork import QLocalServer, QLocalSocket
 
 from pynput import mouse, keyboard
@@ -36,6 +52,10 @@ APP_NAME = "417 KeyGuide"
 APP_ORG = "MyTools"
 APP_VERSION = "0.9.0-beta" 
 IPC_KEY = "417KeyGuide_Instance_Lock_Socket"
+FRAME_INTERVAL_MS = 16 # GUI側で入力をまとめて反映する間隔 (約60FPS)
+MODIFIER_BITS = {'Win': 1, 'Ctrl': 2, 'Alt': 4, 'Shift': 8}
+MODIFIER_NAMES = tuple(tuple(name for name, bit in MODIFIER_BITS.items() if mask & bit) for mask in range(16)) # ビットマスク → 表示順の修飾キー名
+MODIFIER_PREFIXES = tuple("".join(f"{name}+" for name in names) for names in MODIFIER_NAMES)
 
 # --- スクロールバーの共通スタイル ---
 SCROLLBAR_STYLESHEET = """
@@ -127,11 +147,147 @@ class NoScrollSlider(QSlider):
         self.setFocusPolicy(Qt.FocusPolicy.StrongFocus)
     def wheelEvent(self, event): event.ignore()
 
+# --- 連続ストローク (例: "Ctrl+K, Ctrl+C") 用のプレフィックス木 ---
+class ChordNode:
+    __slots__ = ('children', 'item')
+    def __init__(self): self.children = {}; self.item = None
+
+class ChordTrie:
+    # 作った後は書き換えない。フックスレッドが辿っている最中でも壊れないよう、変更時は新しい木を作って参照ごと差し替える
+    def __init__(self, entries=None):
+        self.root = ChordNode()
+        self.entries = dict(entries or {}) # ストローク列(正規化済みタプル) → ショートカット項目
+        for seq, item in self.entries.items():
+            node = self.root
+            for stroke in seq: node = node.children.setdefault(stroke, ChordNode())
+            node.item = item
+
+class ChordMatcher:
+    def __init__(self, timeout_ms=1500):
+        self.timeout = timeout_ms / 1000.0
+        self.node = None; self.strokes = []; self.deadline = 0.0; self.trie = None
+
+    def reset(self): self.node = None; self.strokes = []
+
+    def feed(self, trie, combo_text, now):
+        if not trie.root.children: return None
+        key = ShortcutIndex.canonical(combo_text)
+        if all(part in ShortcutIndex.MODIFIER_RANK for part in key.split("+")): return None # 修飾キー単体は照合に影響させない
+        if self.trie is not trie or now > self.deadline: self.reset(); self.trie = trie # 木が差し替えられたら入力途中の照合は捨てる
+        node = (self.node or trie.root).children.get(key)
+        if node is None and self.node is not None:
+            self.reset(); node = trie.root.children.get(key) # 途中で外れた場合はこのストロークから数え直す
+        if node is None: return None
+        self.node = node; self.strokes.append(combo_text); self.deadline = now + self.timeout
+        if node.item is None: return None
+        strokes = tuple(self.strokes)
+        if not node.children: self.reset()
+        return strokes, node.item
+
+# --- ショートカット検索インデックス ---
+class ShortcutIndex:
+    # 修飾キーの表記揺れを吸収し、常に Win, Ctrl, Alt, Shift の順に並べる
+    MODIFIER_ALIASES = {"win": "win", "cmd": "win", "super": "win", "meta": "win",
+                        "ctrl": "ctrl", "control": "ctrl", "alt": "alt", "option": "alt", "shift": "shift"}
+    MODIFIER_RANK = {"win": 0, "ctrl": 1, "alt": 2, "shift": 3}
+    CHORD_SEPARATOR = ", "
+
+    def __init__(self, shortcuts=()):
+        self.combos = {}
+        self.chords = ChordTrie()
+        self.build(shortcuts)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=4096)
+    def canonical(combo_text):
+        text = str(combo_text or "").strip()
+        if not text: return ""
+        parts = text.split("+")
+        if text.endswith("+"): parts = parts[:-2] + ["+"] # "Ctrl++" のように末尾が「+」キーの場合
+        mods = set(); keys = []
+        for part in parts:
+            part = part.strip()
+            if not part: continue
+            low = part.casefold()
+            if low in ShortcutIndex.MODIFIER_ALIASES: mods.add(ShortcutIndex.MODIFIER_ALIASES[low])
+            else: keys.append(low)
+        return "+".join(sorted(mods, key=ShortcutIndex.MODIFIER_RANK.get) + sorted(keys))
+
+    def build(self, shortcuts):
+        combos = {}; chords = {}
+        for item in shortcuts:
+            if item.get("enabled") and item.get("type") == "key":
+                combo = str(item.get("combo") or "")
+                if self.CHORD_SEPARATOR in combo:
+                    seq = tuple(self.canonical(stroke) for stroke in combo.split(self.CHORD_SEPARATOR) if stroke.strip())
+                    if len(seq) > 1: chords.setdefault(seq, item); continue
+                key = self.canonical(combo)
+                if key: combos.setdefault(key, item) # 重複時はリスト上で先の項目を優先
+        self.combos = combos
+        if chords != self.chords.entries: self.chords = ChordTrie(chords) # 変わっていなければ入力途中の照合を生かすため使い続ける
+
+    def lookup(self, combo_text):
+        return self.combos.get(self.canonical(combo_text))
+
+# --- アクティブウィンドウ取得 (プロファイル自動切り替え用) ---
+class ActiveWindowProvider:
+    # どれも GUI スレッドから呼ぶ。handle() は入力のあったフレームごとに呼ばれるため軽量に、describe() はウィンドウが変わった時だけ呼ばれる
+    # watch() は前面ウィンドウの切り替えを通知できる環境なら登録して True を返す
+    def handle(self): return None
+    def describe(self, handle): return ""
+    def watch(self, callback): return False
+
+class StaticWindowProvider(ActiveWindowProvider):
+    # テスト・検証用: set() で指定した文字列をアクティブウィンドウとして扱う
+    def __init__(self, text=""): self.text = text
+    def set(self, text): self.text = text
+    def handle(self): return self.text
+    def describe(self, handle): return handle or ""
+
+class Win32WindowProvider(ActiveWindowProvider):
+    PROCESS_QUERY_LIMITED_INFORMATION = 0x1000
+    EVENT_SYSTEM_FOREGROUND = 0x0003; WINEVENT_OUTOFCONTEXT = 0x0000
+    def __init__(self):
+        import ctypes
+        from ctypes import wintypes
+        self.ctypes = ctypes; self.wintypes = wintypes
+        self.user32 = ctypes.windll.user32; self.kernel32 = ctypes.windll.kernel32
+        self.user32.GetForegroundWindow.restype = wintypes.HWND
+        self.win_event_proc = None; self.win_event_hook = None
+    def watch(self, callback):
+        # OUTOFCONTEXT のフックは登録したスレッド (Qt のメッセージループ) に届くので、GUI スレッドでそのまま処理できる
+        ctypes = self.ctypes; wintypes = self.wintypes
+        proc_type = ctypes.WINFUNCTYPE(None, wintypes.HANDLE, wintypes.DWORD, wintypes.HWND, wintypes.LONG, wintypes.LONG, wintypes.DWORD, wintypes.DWORD)
+        self.win_event_proc = proc_type(lambda *args: callback()) # GC されないよう参照を持っておく
+        self.user32.SetWinEventHook.restype = wintypes.HANDLE
+        self.win_event_hook = self.user32.SetWinEventHook(self.EVENT_SYSTEM_FOREGROUND, self.EVENT_SYSTEM_FOREGROUND, None, self.win_event_proc, 0, 0, self.WINEVENT_OUTOFCONTEXT)
+        return bool(self.win_event_hook)
+    def handle(self): return self.user32.GetForegroundWindow()
+    def describe(self, handle):
+        ctypes = self.ctypes; wintypes = self.wintypes
+        length = self.user32.GetWindowTextLengthW(handle); buf = ctypes.create_unicode_buffer(length + 1)
+        self.user32.GetWindowTextW(handle, buf, length + 1)
+        pid = wintypes.DWORD(); self.user32.GetWindowThreadProcessId(handle, ctypes.byref(pid)); exe_name = ""
+        h_process = self.kernel32.OpenProcess(self.PROCESS_QUERY_LIMITED_INFORMATION, False, pid.value)
+        if h_process:
+            size = wintypes.DWORD(260); path_buf = ctypes.create_unicode_buffer(260)
+            if self.kernel32.QueryFullProcessImageNameW(h_process, 0, path_buf, ctypes.byref(size)): exe_name = os.path.basename(path_buf.value)
+            self.kernel32.CloseHandle(h_process)
+        return f"{exe_name} {buf.value}"
+
+def create_window_provider():
+    if sys.platform == "win32":
+        try: return Win32WindowProvider()
+        except Exception as e: logging.error(f"Failed to init window provider: {e}")
+    return ActiveWindowProvider()
+
 # --- 設定管理クラス ---
 class Config(QObject):
     changed_signal = pyqtSignal(str, object) 
     reload_signal = pyqtSignal()
     language_changed_signal = pyqtSignal() # 言語変更専用シグナル
+    profile_changed_signal = pyqtSignal(str) # アクティブなショートカットプロファイルの切り替え
+    foreground_changed_signal = pyqtSignal() # 前面ウィンドウが切り替わった (通知が取れる環境のみ。他アプリ同士の切り替えも含む)
 
     DEFAULT_SETTINGS = {
         "language": "ja-original", 
@@ -233,6 +389,17 @@ class Config(QObject):
         "log_middle_drag": True,
         "log_scroll": True,
         "drag_threshold": 15,
+        "scroll_burst_ms": 400,
+        "storm_threshold_eps": 300,
+        "capture_mode": "thread", # "process": 入力フックを別プロセスで動かす (再起動後に反映)
+        "capture_ring_records": 65536,
+        "input_backend": "pynput", # "pynput" / "evdev" (Linux: /dev/input を直接読む。再起動後に反映)
+        "log_renderer": "widgets", # "painted": ログ項目をウィジェットにせず、オーバーレイ1枚にまとめて描く
+        "journal_enabled": False,
+        "journal_segment_records": 262144,
+        "journal_max_segments": 8,
+        "latency_trace_enabled": False,
+        "chord_timeout_ms": 1500,
         "icon_paths": { "left": "", "right": "", "middle": "" },
         "log_display_mode": 0,
         "mod_mouse_display_mode": 1,
@@ -288,7 +455,7 @@ class Config(QObject):
         "ui.sc.msg_imp_mode": "件のデータを読み込みました。\nモードを選択してください", "ui.sc.btn_append": "追加 (末尾)", "ui.sc.btn_overwrite": "上書き (置換)",
         "ui.sc.msg_exp_opt": "出力形式を選択してください", "ui.sc.btn_full": "フル設定 (JSON)", "ui.sc.btn_simple": "キーと説明のみ (Simple)", "ui.sc.msg_saved": "保存しました。",
         "ui.sc.btn_reset": "初期化", "ui.sc.reset_confirm_title": "確認", "ui.sc.reset_confirm_msg": "ショートカットリストを初期状態（デフォルト）に戻しますか？\n現在のリストは破棄されます。",
-        "ui.tray.log": "ログ 有効/無効", "ui.tray.cheat": "チートシート 有効/無効", "ui.tray.settings": "設定", "ui.tray.exit": "アプリの終了",
+        "ui.tray.log": "ログ 有効/無効", "ui.tray.cheat": "チートシート 有効/無効", "ui.tray.settings": "設定", "ui.tray.exit": "アプリの終了", "ui.log.storm": "入力ストーム",
         "ui.lang.note_missing": "データが一部不足している場合、各言語の初期値または日本語にします。",
         "ui.lang.note_corrupt": "データが破損した場合は、[config]フォルダ内の、問題のあるjsonデータを削除してください。\n全てのjsonデータは、削除後にアプリの再起動や設定変更をすると自動で再生成されます。"
     }
@@ -307,12 +474,22 @@ class Config(QObject):
     FILE_SHORTCUTS = "shortcuts.json"
     CONFIG_DIR_NAME = "config"
     LANG_DIR_NAME = "language"
+    PROFILE_DIR_NAME = "profiles"
+    DEFAULT_PROFILE = "default"
 
     def __init__(self):
         super().__init__()
         self.data = self.DEFAULT_SETTINGS.copy()
         self.shortcuts = self.DEFAULT_SHORTCUTS.copy()
+        self.shortcut_index = ShortcutIndex(self.shortcuts)
         self.locale_data = self.DEFAULT_LOCALE.copy()
+
+        # プロファイル: 既定 (shortcuts.json) 以外は profiles/<名前>.json から読み込み、索引を事前構築して保持する
+        self.profiles = {}
+        self.active_profile = self.DEFAULT_PROFILE
+        self.active_index = self.shortcut_index
+        self.window_provider = create_window_provider()
+        self._last_window = None
         
         self.undo_stack = []
         self.redo_stack = []
@@ -321,11 +498,13 @@ class Config(QObject):
         self.data_dir = Path(".")
         self.config_dir = Path(".")
         self.lang_dir = Path(".")
+        self.profile_dir = Path(self.PROFILE_DIR_NAME)
         
         self.save_timer = QTimer()
         self.save_timer.setSingleShot(True)
         self.save_timer.setInterval(500)
         self.save_timer.timeout.connect(self._perform_save)
+        self.read_only = False # リプレイ等、利用者の設定ファイルを書き換えてはいけない起動では True にする
 
     def init_paths(self):
         try:
@@ -339,11 +518,14 @@ class Config(QObject):
             self.data_dir = Path(base_path)
             self.config_dir = self.data_dir / self.CONFIG_DIR_NAME
             self.lang_dir = self.config_dir / self.LANG_DIR_NAME
+            self.profile_dir = self.config_dir / self.PROFILE_DIR_NAME
             
             if not self.config_dir.exists():
                 self.config_dir.mkdir(parents=True, exist_ok=True)
             if not self.lang_dir.exists():
                 self.lang_dir.mkdir(parents=True, exist_ok=True)
+            if not self.profile_dir.exists():
+                self.profile_dir.mkdir(parents=True, exist_ok=True)
                 
             print(f"Config directory: {self.config_dir}") 
         except Exception as e:
@@ -389,11 +571,61 @@ class Config(QObject):
                                 if "show_in_cheat" not in item: item["show_in_cheat"] = True
                                 self.shortcuts.append(item)
             except Exception as e: logging.error(f"Failed to load shortcuts: {e}")
+        self.shortcut_index.build(self.shortcuts)
+        self.load_profiles()
 
         self._load_custom_fonts()
         self.ensure_language_files()
         self.load_locale()
 
+    def load_profiles(self):
+        # 形式: {"match": ["blender", ...], "shortcuts": [...]}  matchはプロセス名/ウィンドウタイトルの部分一致(大小無視)
+        profiles = {}
+        for path in sorted(self.profile_dir.glob("*.json")) if self.profile_dir.exists() else []:
+            try:
+                with open(path, 'r', encoding='utf-8') as f: data = json.load(f)
+                shortcuts = [item for item in data.get("shortcuts", []) if isinstance(item, dict)]
+                for item in shortcuts:
+                    item.setdefault("show_in_log", True); item.setdefault("show_in_cheat", True)
+                match = [str(m).casefold() for m in data.get("match", []) if str(m).strip()]
+                profiles[path.stem] = {"match": match, "shortcuts": shortcuts, "index": ShortcutIndex(shortcuts)}
+            except Exception as e: logging.error(f"Failed to load profile {path}: {e}")
+        self.profiles = profiles; self._last_window = None
+        self.switch_profile(self.DEFAULT_PROFILE)
+
+    def set_window_provider(self, provider):
+        self.window_provider = provider; self._last_window = None
+
+    def watch_foreground(self):
+        # 前面ウィンドウの切り替え通知が取れる環境では、入力を待たずに切り替えた時点でプロファイルを合わせる
+        try: return self.window_provider.watch(self._on_foreground_changed)
+        except Exception as e: logging.error(f"Failed to watch foreground window: {e}"); return False
+
+    def switch_profile(self, name):
+        profile = self.profiles.get(name)
+        if profile is None: name = self.DEFAULT_PROFILE
+        # 索引は構築済みなので参照の差し替えだけで切り替わる
+        self.active_index = profile["index"] if profile else self.shortcut_index
+        if name != self.active_profile: self.active_profile = name; self.profile_changed_signal.emit(name)
+
+    def _on_foreground_changed(self): self.sync_active_profile(); self.foreground_changed_signal.emit()
+
+    def sync_active_profile(self):
+        # GUI スレッド専用。フック側は active_index を読むだけで、差し替えは参照の代入1回で済む
+        if not self.profiles: return
+        try:
+            handle = self.window_provider.handle()
+            if handle == self._last_window: return
+            self._last_window = handle
+            window_text = self.window_provider.describe(handle).casefold()
+            name = next((n for n, p in self.profiles.items() if any(m in window_text for m in p["match"])), self.DEFAULT_PROFILE)
+            if name != self.active_profile: self.switch_profile(name)
+        except Exception as e: logging.error(f"Failed to sync active profile: {e}")
+
+    def get_active_shortcuts(self):
+        profile = self.profiles.get(self.active_profile)
+        return profile["shortcuts"] if profile else self.shortcuts
+
     def ensure_language_files(self):
         try:
             # 1. ja-original.json (常に再生成)
@@ -483,6 +715,7 @@ class Config(QObject):
             if os.path.exists(path): QFontDatabase.addApplicationFont(path)
 
     def save(self):
+        if self.read_only: return
         self.save_timer.start()
 
     def force_save(self):
@@ -519,7 +752,10 @@ class Config(QObject):
 
     def set(self, key, value, record_history=True):
         current_val = self.shortcuts if key == "shortcuts_list" else self.data.get(key)
-        if current_val == value: return
+        if current_val == value:
+            # 同じリストをその場で書き換えた場合もインデックスだけは作り直す
+            if key == "shortcuts_list" and value is self.shortcuts: self.shortcut_index.build(self.shortcuts)
+            return
 
         if record_history and not self.is_undoing:
             import copy
@@ -527,7 +763,7 @@ class Config(QObject):
             self.undo_stack.append((key, old_val))
             self.redo_stack.clear() 
 
-        if key == "shortcuts_list": self.shortcuts = value
+        if key == "shortcuts_list": self.shortcuts = value; self.shortcut_index.build(value)
         else: self.data[key] = value
         
         # 言語設定が変更された場合、即座にロケールを再読み込み
@@ -559,11 +795,7 @@ class Config(QObject):
         self.set(key, new_val, record_history=False)
         self.is_undoing = False
 
-    def get_shortcut_item(self, combo_text):
-        for item in self.shortcuts:
-            if item.get("enabled") and item.get("type") == "key":
-                if item.get("combo") == combo_text: return item
-        return None
+    def get_shortcut_item(self, combo_text): return self.active_index.lookup(combo_text)
 
     def get_shortcut_desc(self, combo_text):
         item = self.get_shortcut_item(combo_text)
@@ -594,31 +826,595 @@ class Config(QObject):
 
 config = Config()
 
+# --- レイテンシ計測 (入力から描画までの段階別) ---
+class LatencyTracker:
+    # hook: フック内処理, queue: フック→add_key, build: KeyItem生成, paint: 生成→初回描画, total: フック→初回描画, frame: FrameClock 1フレームの処理時間
+    STAGES = ("hook", "queue", "build", "paint", "total", "frame")
+
+    def __init__(self, capacity=4096):
+        self.enabled = False
+        self.samples = {stage: collections.deque(maxlen=capacity) for stage in self.STAGES}
+
+    def add(self, stage, seconds):
+        if self.enabled: self.samples[stage].append(seconds)
+
+    def clear(self):
+        for samples in self.samples.values(): samples.clear()
+
+    def snapshot(self):
+        result = {}
+        for stage, samples in self.samples.items():
+            values = sorted(samples)
+            if not values: result[stage] = {"count": 0}; continue
+            pick = lambda ratio: round(values[min(len(values) - 1, int(len(values) * ratio))] * 1000, 3)
+            result[stage] = {"count": len(values), "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99), "max_ms": round(values[-1] * 1000, 3)}
+        return result
+
+    def dump(self, path, extra=None):
+        try:
+            with open(path, 'w', encoding='utf-8') as f: json.dump({**self.snapshot(), **(extra or {})}, f, indent=4)
+            logging.info(f"Latency stats written to {path}")
+        except Exception as e: logging.error(f"Failed to dump latency stats: {e}")
+
+latency = LatencyTracker()
+
+# --- 共有フレームクロック (表示項目のフェード等をまとめて進める) ---
+class FrameClock(QObject):
+    # 登録したオブジェクトの advance(now) を1つのタイマーでまとめて呼ぶ
+    # advance は次に呼んでほしい時刻 (time.time() 基準) を返し、None なら登録解除。誰も動いていなければタイマーは止まる
+    def __init__(self, interval_ms=FRAME_INTERVAL_MS):
+        super().__init__()
+        self.interval_ms = interval_ms
+        self.due = {}
+        self.frames = 0; self.last_frame_ms = 0.0
+        self.timer = QTimer(); self.timer.setSingleShot(True); self.timer.timeout.connect(self.tick)
+        self.update_settings()
+        config.changed_signal.connect(self.update_settings); config.reload_signal.connect(self.update_settings)
+
+    def update_settings(self, key=None, value=None):
+        # フレームごとに config.get しないよう、アニメーションに使う設定はここで控えておく
+        self.display_time = config.get("display_time"); self.fade_duration = config.get("fade_duration")
+
+    def add(self, obj):
+        self.due[obj] = 0.0
+        if not self.timer.isActive() or self.timer.remainingTime() > self.interval_ms: self.timer.start(self.interval_ms)
+
+    def remove(self, obj): self.due.pop(obj, None)
+
+    def tick(self):
+        t0 = time.perf_counter(); now = time.time(); idle.note_wakeup()
+        for obj, due in list(self.due.items()):
+            if due > now: continue
+            try: next_due = obj.advance(now)
+            except RuntimeError: next_due = None # 破棄済みのウィジェット
+            if next_due is None: self.due.pop(obj, None)
+            else: self.due[obj] = next_due
+        self.frames += 1; self.last_frame_ms = (time.perf_counter() - t0) * 1000; latency.add("frame", self.last_frame_ms / 1000)
+        if self.due: self.timer.start(max(self.interval_ms, int((min(self.due.values()) - now) * 1000)))
+
+    def stats(self): return {"frames": self.frames, "active": len(self.due), "last_frame_ms": round(self.last_frame_ms, 3), "running": self.timer.isActive()}
+
+frame_clock = FrameClock()
+
+class ProximityService:
+    # 「マウスが近づいたら項目を薄くする」を全項目まとめて計算する
+    # カーソル位置は FrameClock の1フレームに1回だけ読み、動いていなければ何もしない。各項目の中心座標はレイアウトが変わるまで控えておく
+    def __init__(self):
+        self.entries = {} # 項目 -> 中心のグローバル座標 (非表示なら None)
+        self.stale = True; self.last_pos = None; self.samples = 0; self.passes = 0
+        self.update_settings()
+        config.changed_signal.connect(self.update_settings); config.reload_signal.connect(self.update_settings)
+
+    def update_settings(self, key=None, value=None):
+        if key is not None and not key.startswith("item_proximity"): return
+        self.enabled = config.get("item_proximity_enabled"); self.dist = config.get("item_proximity_dist"); self.min_opacity = config.get("item_proximity_min_opacity")
+        self.last_pos = None; self.wake()
+
+    def track(self, entry): self.entries[entry] = None; self.invalidate()
+
+    def untrack(self, entry): self.entries.pop(entry, None)
+
+    def invalidate(self): self.stale = True; self.wake()
+
+    def wake(self):
+        if self.entries: frame_clock.add(self)
+
+    def advance(self, now):
+        if not self.enabled or not self.entries:
+            for entry in self.entries: entry.set_prox_opacity(1.0)
+            self.last_pos = None; return None
+        pos = QCursor.pos(); self.samples += 1
+        if pos == self.last_pos and not self.stale: return now
+        if self.stale:
+            for entry in self.entries: self.entries[entry] = entry.global_center()
+            self.stale = False
+        self.last_pos = pos; self.passes += 1; px = pos.x(); py = pos.y(); thresh = self.dist; min_op = self.min_opacity
+        for entry, center in self.entries.items():
+            prox_opacity = 1.0
+            if center is not None:
+                dist = math.hypot(px - center.x(), py - center.y())
+                if dist < thresh: prox_opacity = max(min_op, min(1.0, min_op + (1.0 - min_op) * dist / thresh))
+            entry.set_prox_opacity(prox_opacity)
+        return now
+
+    def stats(self): return {"entries": len(self.entries), "cursor_samples": self.samples, "distance_passes": self.passes}
+
+proximity = ProximityService()
+
+class IdleScheduler:
+    # 定期タイマーをまとめて管理し、表示中の項目も押下中のキーも無くなったら止めて (park)、次の入力で再開する
+    # FrameClock・入力の取り出し・定期タイマー等で実際に起きた回数を数え、アイドル中に 0/秒 になっていることを確かめられるようにする
+    def __init__(self):
+        self.timers = [] # (QTimer, 間隔ms, 仕事が残っているか)
+        self.parked = False; self.parks = 0; self.resumes = 0
+        self.lock = threading.Lock() # 受信スレッドからも数える
+        self.wakeups = 0; self.bucket = 0; self.bucket_count = 0; self.last_rate = 0
+
+    def add_timer(self, timer, interval_ms, is_busy):
+        self.timers.append((timer, interval_ms, is_busy))
+        timer.timeout.connect(self._after_tick) # 本来の処理の後に呼ばれるよう、接続済みのスロットより後に繋ぐ
+        if not self.parked: timer.start(interval_ms)
+
+    def _after_tick(self):
+        self.note_wakeup()
+        if not any(is_busy() for _, _, is_busy in self.timers): self.park()
+
+    def park(self):
+        if self.parked: return
+        for timer, _, _ in self.timers: timer.stop()
+        self.parked = True; self.parks += 1
+
+    def resume(self):
+        if not self.parked: return
+        self.parked = False; self.resumes += 1
+        for timer, interval_ms, _ in self.timers: timer.start(interval_ms)
+
+    def note_wakeup(self):
+        second = int(time.monotonic())
+        with self.lock:
+            if second != self.bucket:
+                self.last_rate = self.bucket_count if second == self.bucket + 1 else 0; self.bucket = second; self.bucket_count = 0
+            self.bucket_count += 1; self.wakeups += 1
+
+    def wakeups_per_sec(self):
+        # 直前の1秒間の回数。何も起きていなければバケツが更新されないので、経過秒から 0 と判断する
+        second = int(time.monotonic())
+        with self.lock:
+            if second == self.bucket: return self.last_rate
+            return self.bucket_count if second == self.bucket + 1 else 0
+
+    def stats(self): return {"parked": self.parked, "parks": self.parks, "resumes": self.resumes, "wakeups": self.wakeups, "wakeups_per_sec": self.wakeups_per_sec()}
+
+idle = IdleScheduler()
+
+# --- 入力イベントキュー (フックスレッド → GUIスレッド) ---
+class InputEventRing:
+    # 固定長リングバッファ。deque の append/popleft はGIL下でアトミックなためロック不要
+    def __init__(self, capacity=4096):
+        self.capacity = capacity
+        self.buffer = collections.deque(maxlen=capacity)
+        self.dropped = 0
+
+    def push(self, record):
+        if len(self.buffer) >= self.capacity: self.dropped += 1 # 溢れた場合は最古のレコードが押し出される
+        self.buffer.append(record)
+
+    def drain(self):
+        records = []; pop = self.buffer.popleft
+        try:
+            while True: records.append(pop())
+        except IndexError: pass
+        return records
+
+# --- スクロールのバースト集計 ---
+class ScrollCoalescer:
+    # 同じ方向・同じ修飾キーのスクロールが一定時間内に続く間、ノッチ数を合算する
+    def __init__(self, window_ms=400):
+        self.window = window_ms / 1000.0
+        self.key = None; self.total = 0; self.last_ts = 0.0
+        self.burst = 0 # 数え直すたびに進める番号。表示側はこれで「別のバースト」を見分ける
+
+    def feed(self, key, notches, ts):
+        if key == self.key and ts - self.last_ts < self.window: self.total += notches
+        else: self.key = key; self.total = notches; self.burst += 1
+        self.last_ts = ts
+        return self.total
+
+# --- 入力ストーム抑制 (マクロ・バーコードリーダー・キーリピート等の大量入力) ---
+class RateGovernor:
+    # 直近の入力レートが閾値を超えている間は、フレームごとのログを1件の「ストーム」項目にまとめて件数だけ数える
+    # レートはスクロール以外のログ項目 (表示対象になった押下・クリック1回につき1件) の数で測る。スクロールは既にまとめ済みで、普通に回すだけで数十件/秒になるので数えない
+    def __init__(self, threshold_eps=300, window_ms=500):
+        self.threshold = threshold_eps # 0 で無効
+        self.window = window_ms / 1000.0
+        self.history = collections.deque(); self.in_window = 0
+        self.storm = None; self.merged_total = 0; self.bursts = 0
+
+    def reset(self): self.history.clear(); self.in_window = 0; self.storm = None
+
+    def admit(self, batch, now):
+        rated = [e for e in batch if e.action != InputAction.SCROLL]
+        history = self.history
+        history.append((now, len(rated))); self.in_window += len(rated)
+        while now - history[0][0] > self.window: self.in_window -= history.popleft()[1]
+        rate = self.in_window / self.window
+        if not rated: return batch
+        if self.storm is None:
+            if not self.threshold or rate <= self.threshold: return batch
+            self.storm = InputEvent(InputAction.STORM, count=0, t_input=rated[0].t_input)
+            self.bursts += 1; self.storm.burst = self.bursts
+        elif rate <= self.threshold / 2: # 閾値付近で出入りを繰り返さないよう、半分まで落ちてから解除する
+            self.finish(); return batch
+        else: self.storm.t_input = 0.0 # 遅延計測は項目を作った最初のフレームだけ
+        self.storm.count += len(rated); self.merged_total += len(rated)
+        # スクロールはまとめずにそのまま流す
+        return [e for e in batch if e.action == InputAction.SCROLL] + [self.storm]
+
+    def finish(self):
+        if self.storm is None: return
+        logging.info(f"Input storm: merged {self.storm.count} events"); self.storm = None
+
+# --- 入力ジャーナル (メモリマップ上の固定長バイナリレコード) ---
+class InputJournal:
+    MAGIC = b"KGJ1"; VERSION = 1
+    HEADER = struct.Struct("<4sHHQ")        # magic, version, record_size, count
+    COUNT_OFFSET = 8
+    RECORD = struct.Struct("<dBBHIIiiii")   # ts, kind, mods, code, vk, char, x, y, dx, dy
+    KIND_KEY_DOWN = 1; KIND_KEY_UP = 2; KIND_CLICK_DOWN = 3; KIND_CLICK_UP = 4; KIND_SCROLL = 5; KIND_MOVE = 6 # MOVE は別プロセスキャプチャのリング専用 (ジャーナルには書かない)
+    # code欄に入れる特殊キー/ボタン名の番号 (互換性のため追記のみ行うこと)
+    KEY_NAMES = ("", "alt", "alt_l", "alt_r", "alt_gr", "backspace", "caps_lock", "cmd", "cmd_l", "cmd_r",
+                 "ctrl", "ctrl_l", "ctrl_r", "delete", "down", "end", "enter", "esc",
+                 "f1", "f2", "f3", "f4", "f5", "f6", "f7", "f8", "f9", "f10", "f11", "f12",
+                 "f13", "f14", "f15", "f16", "f17", "f18", "f19", "f20", "f21", "f22", "f23", "f24",
+                 "home", "left", "page_down", "page_up", "right", "shift", "shift_l", "shift_r", "space", "tab", "up",
+                 "media_play_pause", "media_volume_mute", "media_volume_down", "media_volume_up", "media_previous", "media_next",
+                 "insert", "menu", "num_lock", "pause", "print_screen", "scroll_lock")
+    KEY_CODES = {name: i for i, name in enumerate(KEY_NAMES)}
+    BUTTON_NAMES = ("unknown", "left", "middle", "right", "x1", "x2")
+    BUTTON_CODES = {name: i for i, name in enumerate(BUTTON_NAMES)}
+    FILE_PATTERN = "journal_*.kgj"
+    SEGMENT_SEQ = itertools.count() # プロセス内で通しの連番 (インスタンスを作り直しても戻らない)
+
+    def __init__(self, directory, segment_records=262144, max_segments=8):
+        self.directory = Path(directory)
+        self.segment_records = max(1, int(segment_records))
+        self.max_segments = max(1, int(max_segments))
+        self.lock = threading.Lock()
+        self.file = None; self.mm = None; self.count = 0
+        self.spare = None; self.dropped = 0 # spare: 裏で用意しておく次のセグメント (file, mm)
+        self.tasks = queue.Queue(); self.worker = None
+
+    def open(self):
+        with self.lock:
+            if self.mm is not None: return
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.file, self.mm = self._create_segment(); self.count = 0
+        # ファイルの作成・切り詰め・古いセグメントの削除は全て裏のスレッドで行い、フック側は用意済みのものと差し替えるだけにする
+        self.worker = threading.Thread(target=self._run, name="KeyGuideJournal", daemon=True); self.worker.start()
+        self.tasks.put(("prepare",))
+
+    def close(self):
+        with self.lock:
+            current = (self.file, self.mm, self.count)
+            self.file = None; self.mm = None; self.count = 0
+        if self.worker is not None: self.tasks.put(None); self.worker.join(); self.worker = None # 積まれた後始末を済ませてから
+        if current[1] is not None: self._retire(*current)
+        with self.lock: spare = self.spare; self.spare = None
+        if spare is not None: self._retire(*spare, 0, remove=True) # 一度も書かなかった予備は残さない
+
+    def _run(self):
+        while True:
+            task = self.tasks.get()
+            if task is None: return
+            try:
+                if task[0] == "prepare":
+                    spare = self._create_segment()
+                    with self.lock: self.spare = spare
+                    self._prune()
+                else: self._retire(*task[1:])
+            except Exception as e: logging.error(f"Journal {task[0]} failed: {e}")
+
+    def _create_segment(self):
+        size = self.HEADER.size + self.RECORD.size * self.segment_records
+        while True:
+            # 同じ秒に複数回切り替わっても、別インスタンス・別プロセスと重なっても名前が被らないようにし、既存ファイルは決して上書きしない
+            now = time.time()
+            name = time.strftime("journal_%Y%m%d_%H%M%S", time.localtime(now)) + f"_{int(now * 1000) % 1000:03d}_{os.getpid()}_{next(self.SEGMENT_SEQ):04d}.kgj"
+            try: file = open(self.directory / name, "x+b"); break
+            except FileExistsError: continue
+        file.truncate(size)
+        mm = mmap.mmap(file.fileno(), size)
+        self.HEADER.pack_into(mm, 0, self.MAGIC, self.VERSION, self.RECORD.size, 0)
+        return file, mm
+
+    def _retire(self, file, mm, count, remove=False):
+        try:
+            mm.flush(); mm.close()
+            file.truncate(self.HEADER.size + self.RECORD.size * count) # 未使用領域は切り詰めてディスクを節約
+            file.close()
+            if remove: os.unlink(file.name)
+        except Exception as e: logging.error(f"Failed to close journal segment: {e}")
+
+    def _prune(self):
+        # 用意したばかりの予備は数に入れず、書き込み済みのセグメントを max_segments 個まで残す
+        segments = sorted(self.directory.glob(self.FILE_PATTERN))
+        for old in segments[:-(self.max_segments + 1)]:
+            try: old.unlink()
+            except OSError as e: logging.error(f"Failed to remove journal segment {old}: {e}")
+
+    def record(self, kind, mods=0, code=0, vk=0, char=0, x=0, y=0, dx=0, dy=0):
+        ts = time.time()
+        with self.lock:
+            if self.mm is None: return
+            if self.count >= self.segment_records:
+                # 用意済みの予備と差し替えるだけ。裏の準備が追いつかない間は待たずに捨てて数える
+                if self.spare is None: self.dropped += 1; return
+                self.tasks.put(("retire", self.file, self.mm, self.count))
+                (self.file, self.mm), self.spare, self.count = self.spare, None, 0
+                self.tasks.put(("prepare",))
+            self.RECORD.pack_into(self.mm, self.HEADER.size + self.count * self.RECORD.size, ts, kind, mods, code, vk, char, x, y, dx, dy)
+            self.count += 1
+            struct.pack_into("<Q", self.mm, self.COUNT_OFFSET, self.count)
+
+    def record_key(self, kind, key, mods): self.record(kind, mods, *self.encode_key(key))
+
+    @classmethod
+    def encode_key(cls, key):
+        name = getattr(key, 'name', None) or ""
+        code_obj = getattr(key, 'value', key) # Key列挙子は value に KeyCode を持つ
+        vk = getattr(code_obj, 'vk', None) or 0
+        char = getattr(key, 'char', None)
+        return cls.KEY_CODES.get(name, 0), vk & 0xFFFFFFFF, ord(char) if char and len(char) == 1 else 0
+
+    @classmethod
+    def read(cls, path):
+        with open(path, "rb") as f: data = f.read()
+        if len(data) < cls.HEADER.size: return []
+        magic, version, record_size, count = cls.HEADER.unpack_from(data, 0)
+        if magic != cls.MAGIC or record_size != cls.RECORD.size: raise ValueError(f"Not a KeyGuide journal: {path}")
+        count = min(count, (len(data) - cls.HEADER.size) // record_size)
+        body = memoryview(data)[cls.HEADER.size:cls.HEADER.size + count * record_size]
+        return list(cls.RECORD.iter_unpack(body))
+
+# --- 入力イベント (フックからオーバーレイまでそのまま受け渡す) ---
+class InputAction(enum.IntEnum):
+    KEY = 0; MOUSE = 1; SCROLL = 2; CHORD = 3; STORM = 4
+
+class InputEvent:
+    __slots__ = ('action', 'mods', 'keys', 'button', 'desc', 'is_char', 'count', 'burst', 't_input', '_text')
+    COMBO_ACTIONS = (InputAction.KEY, InputAction.MOUSE, InputAction.SCROLL)
+
+    def __init__(self, action, mods=0, keys=(), button="", desc="", is_char=False, count=1, t_input=0.0):
+        self.action = action
+        self.mods = mods       # MODIFIER_BITS のビットマスク
+        self.keys = keys       # 修飾キー以外のキー名 (マウスは操作名、連続ストロークは各ストロークの表記)
+        self.button = button   # アイコン表示用のボタン種別 (left/right/middle)
+        self.desc = desc
+        self.is_char = is_char
+        self.count = count     # スクロールはバースト中の合計ノッチ数
+        self.burst = 0         # スクロール・ストームのバースト番号 (count が数え直された境目)
+        self.t_input = t_input
+        self._text = None
+
+    @property
+    def label(self):
+        if self.action == InputAction.KEY: return "+".join(self.keys)
+        if self.action == InputAction.CHORD: return ShortcutIndex.CHORD_SEPARATOR.join(self.keys)
+        if self.action == InputAction.STORM: return config.tr("ui.log.storm", "入力ストーム")
+        aliases = config.get("mouse_aliases"); return aliases.get(self.keys[0], self.keys[0])
+
+    @property
+    def text(self):
+        # 表示用の文字列は最初に必要になった時に1度だけ組み立てる
+        if self._text is None:
+            if self.action == InputAction.KEY: self._text = "+".join(MODIFIER_NAMES[self.mods] + self.keys)
+            elif self.action in (InputAction.CHORD, InputAction.STORM): self._text = self.label
+            else: self._text = MODIFIER_PREFIXES[self.mods] + self.label
+        return self._text
+
+    def same_as(self, other):
+        return self.action == other.action and self.mods == other.mods and self.keys == other.keys
+
+    def extends(self, other):
+        # other の修飾キー・キーを全て含み、さらに何か押し足したもの (Ctrl → Ctrl+C 等)
+        if self.action not in self.COMBO_ACTIONS or other.action not in self.COMBO_ACTIONS or other.mods & ~self.mods: return False
+        if not all(k in self.keys for k in other.keys): return False
+        return self.mods != other.mods or len(self.keys) > len(other.keys)
+
+# --- 入力バックエンド (キー・マウスのフック元) ---
+class InputBackend:
+    # start() に渡したコールバックを pynput のリスナーと同じ引数で、GUIスレッド以外から呼び出す (on_move は省略可)
+    name = ""
+    def start(self, on_press, on_release, on_click, on_scroll, on_move=None): pass
+    def stop(self): pass
+
+class PynputBackend(InputBackend):
+    name = "pynput"
+    def __init__(self): self.k_listener = None; self.m_listener = None
+    def start(self, on_press, on_release, on_click, on_scroll, on_move=None):
+        self.k_listener = keyboard.Listener(on_press=on_press, on_release=on_release); self.k_listener.start()
+        self.m_listener = mouse.Listener(on_click=on_click, on_scroll=on_scroll, on_move=on_move); self.m_listener.start()
+    def stop(self):
+        if self.k_listener: self.k_listener.stop()
+        if self.m_listener: self.m_listener.stop()
+
+class SyntheticBackend(InputBackend):
+    # テスト・ベンチマーク・リプレイ用: 実際のフックを使わず、呼び出し元のスレッドから直接入力を流し込む
+    name = "synthetic"
+    def __init__(self): self.callbacks = None
+    def start(self, on_press, on_release, on_click, on_scroll, on_move=None): self.callbacks = (on_press, on_release, on_click, on_scroll, on_move)
+    def stop(self): self.callbacks = None
+    def press(self, key):
+        if self.callbacks: self.callbacks[0](key)
+    def release(self, key):
+        if self.callbacks: self.callbacks[1](key)
+    def click(self, x, y, button, pressed):
+        if self.callbacks: self.callbacks[2](x, y, button, pressed)
+    def scroll(self, x, y, dx, dy):
+        if self.callbacks: self.callbacks[3](x, y, dx, dy)
+    def move(self, x, y):
+        if self.callbacks and self.callbacks[4]: self.callbacks[4](x, y)
+
+class EvdevBackend(InputBackend):
+    # Linux: /dev/input/event* をノンブロッキングで開き、select で待って溜まった分をまとめて読む
+    name = "evdev"
+    EVENT = struct.Struct("llHHi") # struct input_event: tv_sec, tv_usec, type, code, value
+    READ_EVENTS = 64
+    EV_KEY = 1; EV_REL = 2
+    _MISSING = object()
+    REL_X = 0; REL_Y = 1; REL_HWHEEL = 6; REL_WHEEL = 8
+    BUTTONS = {0x110: "left", 0x111: "right", 0x112: "middle", 0x113: "x1", 0x114: "x2"}
+    # Linuxのキーコード → (pynputのKey名, 文字)。文字キーは US 配列で、Shift 中は pynput と同じく Shift 後の文字を渡す
+    MAIN_CODES = list(range(2, 14)) + list(range(16, 28)) + list(range(30, 42)) + list(range(43, 54))
+    KEY_CHARS = dict(zip(MAIN_CODES, "1234567890-=qwertyuiop[]asdfghjkl;'`\\zxcvbnm,./"))
+    SHIFTED_CHARS = dict(zip(MAIN_CODES, "!@#$%^&*()_+QWERTYUIOP{}ASDFGHJKL:\"~|ZXCVBNM<>?"))
+    SHIFT_CODES = (42, 54)
+    VK_BASE = 0x10000 # pynput の vk と重ならない範囲にキーコードを割り当て、Shift で文字が変わっても押下と解放を同じキーとして扱わせる
+    KEY_CHARS.update({55: '*', 71: '7', 72: '8', 73: '9', 74: '-', 75: '4', 76: '5', 77: '6', 78: '+', 79: '1', 80: '2', 81: '3', 82: '0', 83: '.', 98: '/'})
+    KEY_NAMES = {1: "esc", 14: "backspace", 15: "tab", 28: "enter", 29: "ctrl_l", 42: "shift", 54: "shift_r", 56: "alt_l", 57: "space",
+                 58: "caps_lock", 69: "num_lock", 70: "scroll_lock", 87: "f11", 88: "f12", 96: "enter", 97: "ctrl_r", 99: "print_screen",
+                 100: "alt_r", 102: "home", 103: "up", 104: "page_up", 105: "left", 106: "right", 107: "end", 108: "down", 109: "page_down",
+                 110: "insert", 111: "delete", 113: "media_volume_mute", 114: "media_volume_down", 115: "media_volume_up", 119: "pause",
+                 125: "cmd", 126: "cmd_r", 127: "menu", 163: "media_next", 164: "media_play_pause", 165: "media_previous"}
+    KEY_NAMES.update({59 + i: f"f{i + 1}" for i in range(10)}); KEY_NAMES.update({183 + i: f"f{i + 13}" for i in range(12)})
+
+    def __init__(self, device_dir="/dev/input"):
+        self.device_dir = Path(device_dir)
+        self.fds = []; self._keys = {}; self._buttons = {}; self.shift_down = set()
+        self.x = 0; self.y = 0 # 相対移動の積算値 (中ドラッグの距離判定に使う)
+        self._wake_r = None; self._wake_w = None; self._thread = None
+
+    def start(self, on_press, on_release, on_click, on_scroll, on_move=None):
+        self.callbacks = (on_press, on_release, on_click, on_scroll, on_move)
+        for path in sorted(self.device_dir.glob("event*")):
+            try: self.fds.append(os.open(path, os.O_RDONLY | os.O_NONBLOCK))
+            except OSError: pass
+        if not self.fds: raise OSError(f"No readable input devices in {self.device_dir}")
+        self._wake_r, self._wake_w = os.pipe()
+        self._thread = threading.Thread(target=self._run, name="KeyGuideEvdev", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._wake_w is None: return
+        os.write(self._wake_w, b"\x00")
+        if self._thread: self._thread.join(1.0)
+        for fd in self.fds + [self._wake_r, self._wake_w]:
+            try: os.close(fd)
+            except OSError: pass
+        self.fds = []; self._wake_r = self._wake_w = None
+
+    def _key(self, code):
+        # 対応表に無いキーは None (pynput と同様に記録しない)
+        shifted = bool(self.shift_down) and code in self.SHIFTED_CHARS
+        key = self._keys.get((code, shifted), self._MISSING)
+        if key is self._MISSING:
+            char = self.SHIFTED_CHARS[code] if shifted else self.KEY_CHARS.get(code); name = self.KEY_NAMES.get(code)
+            key = make_synthetic_key(vk=self.VK_BASE + code, char=ord(char)) if char else make_synthetic_key(name) if name else None
+            self._keys[(code, shifted)] = key
+        return key
+
+    def _button(self, name):
+        button = self._buttons.get(name)
+        if button is None: button = self._buttons[name] = make_synthetic_button(name)
+        return button
+
+    def _run(self):
+        size = self.EVENT.size; chunk = size * self.READ_EVENTS
+        while True:
+            ready, _, _ = select.select(self.fds + [self._wake_r], [], [])
+            if self._wake_r in ready: return
+            for fd in ready:
+                try:
+                    while True:
+                        data = os.read(fd, chunk)
+                        if not data: raise OSError("device closed")
+                        for event in self.EVENT.iter_unpack(data[:len(data) - len(data) % size]): self._handle(*event)
+                        if len(data) < chunk: break
+                except BlockingIOError: pass
+                except OSError: self.fds.remove(fd); os.close(fd) # 抜かれたデバイス
+                except Exception: logging.error(f"Evdev Error: {traceback.format_exc()}")
+
+    def _handle(self, sec, usec, etype, code, value):
+        if etype == self.EV_KEY:
+            if value == 2: return # キーリピートは押下中として扱う
+            button = self.BUTTONS.get(code)
+            if button: self.callbacks[2](self.x, self.y, self._button(button), value == 1)
+            elif code < 0x100:
+                if code in self.SHIFT_CODES:
+                    if value: self.shift_down.add(code)
+                    else: self.shift_down.discard(code)
+                key = self._key(code)
+                if key is not None: (self.callbacks[0] if value else self.callbacks[1])(key)
+        elif etype == self.EV_REL:
+            if code == self.REL_X or code == self.REL_Y:
+                # 相対移動なので座標は積算値。画面上の位置は受け取り側が必要な時に調べる
+                if code == self.REL_X: self.x += value
+                else: self.y += value
+                if self.callbacks[4]: self.callbacks[4](self.x, self.y)
+            elif code == self.REL_WHEEL: self.callbacks[3](self.x, self.y, 0, value)
+            elif code == self.REL_HWHEEL: self.callbacks[3](self.x, self.y, value, 0)
+
+INPUT_BACKENDS = {"pynput": PynputBackend, "evdev": EvdevBackend, "synthetic": SyntheticBackend}
+
+def open_input_backend(name, on_press, on_release, on_click, on_scroll, on_move=None):
+    # 指定のバックエンドを開始できなければ pynput に切り替える
+    backend_cls = INPUT_BACKENDS.get(name, PynputBackend)
+    if backend_cls is EvdevBackend and not sys.platform.startswith("linux"): backend_cls = PynputBackend
+    backend = backend_cls()
+    try: backend.start(on_press, on_release, on_click, on_scroll, on_move)
+    except Exception as e:
+        if backend_cls is PynputBackend: raise
+        logging.error(f"Failed to start {name} input backend, falling back to pynput: {e}")
+        backend = PynputBackend(); backend.start(on_press, on_release, on_click, on_scroll, on_move)
+    return backend
+
 # --- 入力検知クラス ---
 class InputWorker(QObject):
-    key_signal = pyqtSignal(str, str, bool)     
-    hold_signal = pyqtSignal(str)         
-    mouse_signal = pyqtSignal(str, bool)
+    EV_LOG = 0; EV_HALO_CLICK = 1; EV_SCROLL = 2; EV_HOLD_END = 3
+    KEY_CACHE_SIZE = 1024
+    SHIFTED_SYMBOLS = "!\"#$%&'()=~|`{+*}<>?_"
+    SINGLE_KEYS_ALWAYS_SHOWN = ('Enter', 'Tab', 'Space', 'Esc', 'Del', 'Backspace', '↑', '↓', '←', '→', 'PrtSc')
+    _CACHE_MISS = object()
+
+    log_batch_signal = pyqtSignal(list) # [InputEvent, ...]
+    hold_release_signal = pyqtSignal() # 押し続けていたキーが離された (表示中の項目の固定を解除する)
     halo_scroll_signal = pyqtSignal(int)
     halo_click_signal = pyqtSignal(str, bool)
+    halo_move_signal = pyqtSignal() # ポインタが動いた (1フレームに1回まで。位置は受け取り側で読む。通常は QCursor、リプレイ時は pointer_point)
     
     cheat_overlay_signal = pyqtSignal(bool)
     cheat_window_signal = pyqtSignal()      
     _timer_ctrl_signal = pyqtSignal(bool)
+    _wake_signal = pyqtSignal()
 
-    def __init__(self):
+    def __init__(self, record_journal=True):
         super().__init__()
         self.pressed_keys = set()
+        self.mod_mask = 0; self.pressed_others = () # pressed_keys を修飾キーのビットマスクとソート済みタプルに分けたもの
         self.pressed_mouse = set()
         self.active_keys = {} 
-        self.k_listener = None
-        self.m_listener = None
+        self.backend = None
         self.last_left_click_time = 0
         self.middle_press_pos = None
         self.overlay_active = False     
         self.just_activated_by_hold = False 
+        self._hold_keys = set() # 固定表示中の組み合わせを押した時に押されていたキー。全部離されたら固定を解く
+        self._pointer_moved = False
+        self.pointer_pos = None # 入力元が最後に報告したポインタ位置 (リプレイでは記録された座標)
         
-        self.last_scroll_time = 0
+        self.scroll_coalescer = ScrollCoalescer()
+        self.rate_governor = RateGovernor()
+        self.chord_matcher = ChordMatcher()
+        self.journal = None; self.record_journal = record_journal # リプレイ中の入力は記録しない
+
+        # フック側はリングに積むだけで即座に戻り、GUI側で1フレーム分をまとめて処理する
+        self.event_ring = InputEventRing()
+        self._wake_pending = False
+        self._last_drain_time = 0
+        self.drain_timer = QTimer()
+        self.drain_timer.setSingleShot(True)
+        self.drain_timer.timeout.connect(self.drain_events)
+        self._wake_signal.connect(self._schedule_drain)
 
         self.cheat_hold_timer = QTimer()
         self.cheat_hold_timer.setSingleShot(True)
@@ -637,11 +1433,9 @@ class InputWorker(QObject):
             'f1': 'F1', 'f2': 'F2', 'f3': 'F3', 'f4': 'F4', 'f5': 'F5', 'f6': 'F6',
             'f7': 'F7', 'f8': 'F8', 'f9': 'F9', 'f10': 'F10', 'f11': 'F11', 'f12': 'F12'
         }
+        self._key_cache = {}
         self.update_settings()
         config.reload_signal.connect(self.update_settings)
-        self.hold_timer = QTimer()
-        self.hold_timer.timeout.connect(self.check_hold)
-        self.hold_timer.setInterval(100)
 
     def update_settings(self):
         self.cfg_log_enabled = config.get("log_enabled")
@@ -655,48 +1449,115 @@ class InputWorker(QObject):
         self.cfg_log_scroll = config.get("log_scroll")
         self.cfg_show_single_keys = config.get("show_single_keys")
         self.cfg_cascadeur_mode = config.get("cascadeur_mode")
-        self.cfg_aliases = config.get("mouse_aliases")
         self.cfg_cheat_enabled = config.get("cheat_sheet_enabled")
         self.cfg_cheat_key = config.get("cheat_sheet_key").upper()
         self.cfg_cheat_hold_ms = config.get("cheat_sheet_hold_ms")
-
-    def start_listening(self):
-        self.k_listener = keyboard.Listener(on_press=self.on_press, on_release=self.on_release)
-        self.k_listener.start()
-        self.m_listener = mouse.Listener(
-            on_click=self.on_click, 
-            on_scroll=self.on_scroll
-        )
-        self.m_listener.start()
-        self.hold_timer.start()
+        self.cfg_halo_enabled = config.get("mouse_halo_enabled")
+        self.scroll_coalescer.window = config.get("scroll_burst_ms") / 1000.0
+        self.rate_governor.threshold = config.get("storm_threshold_eps")
+        self.chord_matcher.timeout = config.get("chord_timeout_ms") / 1000.0
+        self.invalidate_key_cache() # キー表記に関わる設定変更に追従する
+        self._update_journal()
+
+    def _update_journal(self):
+        if config.get("journal_enabled") and self.record_journal:
+            if self.journal is None:
+                try:
+                    journal = InputJournal(config.config_dir / "journal", config.get("journal_segment_records"), config.get("journal_max_segments"))
+                    journal.open(); self.journal = journal
+                except Exception as e: logging.error(f"Failed to open input journal: {e}")
+        elif self.journal is not None:
+            self.journal.close(); self.journal = None
+
+    def _set_pressed(self, k, down):
+        # 押下状態は変化した時だけ差分更新し、各イベントでは組み立て済みの値を使う
+        if down: self.pressed_keys.add(k)
+        else: self.pressed_keys.discard(k)
+        bit = MODIFIER_BITS.get(k)
+        if bit: self.mod_mask = (self.mod_mask | bit) if down else (self.mod_mask & ~bit)
+        elif down: self.pressed_others = tuple(sorted(self.pressed_others + (k,)))
+        else: self.pressed_others = tuple(o for o in self.pressed_others if o != k)
+
+    def start_listening(self, backend=None):
+        # backend 未指定なら設定のバックエンドでフックする (リプレイ等は SyntheticBackend を渡す)
+        if backend is None: self.backend = open_input_backend(config.get("input_backend"), self.on_press, self.on_release, self.on_click, self.on_scroll, self.on_move)
+        else: self.backend = backend; backend.start(self.on_press, self.on_release, self.on_click, self.on_scroll, self.on_move)
 
     def stop_listening(self):
-        if self.k_listener: self.k_listener.stop()
-        if self.m_listener: self.m_listener.stop()
-        self.hold_timer.stop()
-
-    def check_hold(self):
-        if self.pressed_keys:
-            text, _ = self._build_key_text()
-            if text: self.hold_signal.emit(text)
-        
-    def _get_active_modifiers_text(self):
-        modifiers_order = ['Win', 'Ctrl', 'Alt', 'Shift']
-        return [m for m in modifiers_order if m in self.pressed_keys]
-    
-    def _apply_alias(self, raw_name): return self.cfg_aliases.get(raw_name, raw_name)
+        if self.backend: self.backend.stop()
+        self.drain_timer.stop()
+        if self.journal: self.journal.close()
+
+    def _push_event(self, record, t0=0.0):
+        self.event_ring.push(record); self._request_drain()
+        if t0: latency.add("hook", time.perf_counter() - t0)
+
+    def _request_drain(self):
+        if not self._wake_pending: self._wake_pending = True; self._wake_signal.emit()
+
+    @pyqtSlot()
+    def _schedule_drain(self):
+        if self.drain_timer.isActive(): return
+        elapsed_ms = (time.perf_counter() - self._last_drain_time) * 1000
+        self.drain_timer.start(max(0, int(FRAME_INTERVAL_MS - elapsed_ms)))
+
+    def drain_events(self):
+        self._last_drain_time = time.perf_counter()
+        self._wake_pending = False # 先に下ろしておき、drain中に積まれた分は次のフレームで拾う
+        idle.note_wakeup(); idle.resume() # 入力が来たら止めていた定期タイマーを再開する
+        config.sync_active_profile() # ログの有無に関わらず、入力のあったフレームで前面ウィンドウを確かめる (切り替え通知が無い環境向け)
+        log_batch = []; scroll_dy = 0; last_scroll_key = None; hold_released = False
+        pointer_moved = self._pointer_moved; self._pointer_moved = False
+        for record in self.event_ring.drain():
+            kind = record[0]
+            if kind == self.EV_SCROLL:
+                _, dy, event = record
+                scroll_dy = dy
+                if event is None: continue
+                scroll_key = (event.mods, event.keys); event.count = self.scroll_coalescer.feed(scroll_key, max(1, int(abs(dy))), event.t_input); event.burst = self.scroll_coalescer.burst
+                # 同一フレーム内で続いたスクロールは1件にまとめ、合計値だけ更新する
+                if log_batch and last_scroll_key == scroll_key: log_batch[-1] = event
+                else: log_batch.append(event)
+                last_scroll_key = scroll_key; continue
+            last_scroll_key = None
+            if kind == self.EV_LOG:
+                log_batch.append(record[1])
+                if record[1].action == InputAction.KEY: hold_released = False
+            elif kind == self.EV_HOLD_END: hold_released = True
+            elif kind == self.EV_HALO_CLICK: self.halo_click_signal.emit(record[1], record[2])
+        if scroll_dy: self.halo_scroll_signal.emit(scroll_dy)
+        if log_batch: self.log_batch_signal.emit(self.rate_governor.admit(log_batch, self._last_drain_time))
+        # 同じフレーム内で押下→解放が済んでいても、固定→解除の順に反映されるようバッチの後に通知する
+        if hold_released: self.hold_release_signal.emit()
+        if pointer_moved: self.halo_move_signal.emit()
+
+    def on_move(self, x, y): self._note_pointer(x, y)
+
+    def _note_pointer(self, x, y):
+        # 移動は座標を積まずに最後の位置とフラグだけ残す。何百回動いても GUI 側の処理は1フレームに1回
+        # クリック・スクロールの座標も通すので、移動を記録していないジャーナルのリプレイでも Halo が記録上のポインタを追う
+        if (x, y) == self.pointer_pos: return
+        self.pointer_pos = (x, y)
+        if self.cfg_halo_enabled: self._pointer_moved = True; self._request_drain()
+
+    def pointer_point(self):
+        pos = self.pointer_pos
+        return QPoint(int(pos[0]), int(pos[1])) if pos is not None else None
 
     def on_click(self, x, y, button, pressed):
+        t0 = time.perf_counter()
         try:
             btn_name = str(button).replace('Button.', '')
-            self.halo_click_signal.emit(btn_name, pressed)
+            journal = self.journal
+            if journal: journal.record(InputJournal.KIND_CLICK_DOWN if pressed else InputJournal.KIND_CLICK_UP, self.mod_mask, InputJournal.BUTTON_CODES.get(btn_name, 0), x=int(x), y=int(y))
+            self._note_pointer(x, y)
+            self._push_event((self.EV_HALO_CLICK, btn_name, pressed))
             if pressed: self.pressed_mouse.add(btn_name)
             else:
                 if btn_name in self.pressed_mouse: self.pressed_mouse.remove(btn_name)
             if not self.cfg_log_enabled: return 
-            mods = self._get_active_modifiers_text()
-            is_mod_active = len(mods) > 0
-            prefix = "+".join(mods) + ("+" if mods else "")
+            mods = self.mod_mask
+            is_mod_active = mods != 0
             if btn_name == 'middle':
                 if pressed: self.middle_press_pos = (x, y); return 
                 else:
@@ -705,7 +1566,7 @@ class InputWorker(QObject):
                         dist = math.sqrt(dx*dx + dy*dy); self.middle_press_pos = None
                         raw_action = "Middle Click"; should_log = self.cfg_log_middle_click
                         if dist > self.cfg_drag_threshold: raw_action = "Middle Drag"; should_log = self.cfg_log_middle_drag
-                        if should_log or is_mod_active: self.mouse_signal.emit(prefix + self._apply_alias(raw_action), is_mod_active)
+                        if should_log or is_mod_active: self._push_event((self.EV_LOG, InputEvent(InputAction.MOUSE, mods, (raw_action,), 'middle', t_input=t0)), t0)
                     return
             if pressed:
                 should_log = False; raw_text = ""; curr_time = time.time()
@@ -718,29 +1579,37 @@ class InputWorker(QObject):
                     raw_text = "Right Click"
                     if self.cfg_log_right_click or is_mod_active: should_log = True
                 elif btn_name not in ['middle']: raw_text = f"Button {btn_name}"; should_log = True
-                if should_log and raw_text: self.mouse_signal.emit(prefix + self._apply_alias(raw_text), is_mod_active)
+                if should_log and raw_text: self._push_event((self.EV_LOG, InputEvent(InputAction.MOUSE, mods, (raw_text,), btn_name if btn_name in ('left', 'right') else "", t_input=t0)), t0)
         except Exception:
             logging.error(f"Click Error: {traceback.format_exc()}")
 
     def on_scroll(self, x, y, dx, dy):
+        t0 = time.perf_counter()
         try:
-            now = time.time()
-            if now - self.last_scroll_time < 0.03:
-                return
-            self.last_scroll_time = now
-
-            self.halo_scroll_signal.emit(dy)
-            if not self.cfg_log_enabled: return
-            mods = self._get_active_modifiers_text()
-            is_mod_active = len(mods) > 0
-            if self.cfg_log_scroll or is_mod_active:
-                prefix = "+".join(mods) + ("+" if mods else "")
-                direction = "Scroll Up" if dy > 0 else "Scroll Down"
-                self.mouse_signal.emit(prefix + self._apply_alias(direction), is_mod_active)
+            journal = self.journal
+            if journal: journal.record(InputJournal.KIND_SCROLL, self.mod_mask, x=int(x), y=int(y), dx=int(dx), dy=int(dy))
+            self._note_pointer(x, y)
+            if not dy: return
+            # 間引かずに全ノッチを積み、GUI側でバースト単位に合算する
+            mods = self.mod_mask
+            should_log = self.cfg_log_enabled and (self.cfg_log_scroll or mods != 0)
+            event = InputEvent(InputAction.SCROLL, mods, ("Scroll Up" if dy > 0 else "Scroll Down",), 'middle', t_input=t0) if should_log else None
+            self._push_event((self.EV_SCROLL, dy, event), t0 if should_log else 0.0)
         except Exception:
             logging.error(f"Scroll Error: {traceback.format_exc()}")
 
+    def invalidate_key_cache(self): self._key_cache = {}
+
     def _normalize_key(self, key):
+        # (vk, char, キー名) が同じなら結果も同じなので、正規化結果をキャッシュして辞書1回の参照で済ませる
+        cache_key = (getattr(key, 'vk', None), getattr(key, 'char', None), getattr(key, 'name', None))
+        k_str = self._key_cache.get(cache_key, self._CACHE_MISS)
+        if k_str is self._CACHE_MISS:
+            if len(self._key_cache) >= self.KEY_CACHE_SIZE: self._key_cache.clear()
+            k_str = self._key_cache[cache_key] = self._normalize_key_uncached(key)
+        return k_str
+
+    def _normalize_key_uncached(self, key):
         try:
             if hasattr(key, 'vk') and key.vk == 229: return None
             k_str = ""
@@ -766,20 +1635,17 @@ class InputWorker(QObject):
 
     def _get_key_id(self, key): return key.vk if hasattr(key, 'vk') and key.vk is not None else key
 
-    def _build_key_text(self):
-        mods = self._get_active_modifiers_text()
-        others = sorted([x for x in self.pressed_keys if x not in mods])
-        if 'Shift' in mods and len(others) == 1:
-            key_char = others[0]
-            shifted_symbols = "!\"#$%&'()=~|`{+*}<>?_" 
-            if key_char in shifted_symbols: mods.remove('Shift')
-        parts = mods + others
-        if not parts: return None, False
-        is_char_input = (len(mods) == 0)
-        if not self.cfg_show_single_keys and is_char_input and len(parts) == 1:
-            allowed = ['Enter', 'Tab', 'Space', 'Esc', 'Del', 'Backspace', '↑', '↓', '←', '→', 'PrtSc']
-            if parts[0] not in allowed and len(parts[0]) == 1: return None, False
-        return "+".join(parts), is_char_input
+    def _build_key_event(self, t0=0.0):
+        mods = self.mod_mask; others = self.pressed_others
+        if mods & MODIFIER_BITS['Shift'] and len(others) == 1 and others[0] in self.SHIFTED_SYMBOLS: mods &= ~MODIFIER_BITS['Shift']
+        if not mods and not others: return None
+        is_char_input = mods == 0
+        return InputEvent(InputAction.KEY, mods, others, is_char=is_char_input, t_input=t0)
+
+    def _is_hidden_single_key(self, event):
+        # show_single_keys が無効なら修飾キー無しの1文字キーはログに出さない (連続ストロークの判定には使う)
+        if self.cfg_show_single_keys or not event.is_char or len(event.keys) != 1: return False
+        key = event.keys[0]; return key not in self.SINGLE_KEYS_ALWAYS_SHOWN and len(key) == 1
 
     @pyqtSlot(bool)
     def _handle_timer_ctrl(self, start):
@@ -792,37 +1658,57 @@ class InputWorker(QObject):
         self.cheat_overlay_signal.emit(True)
 
     def on_press(self, key):
+        t0 = time.perf_counter()
         try:
+            journal = self.journal
+            if journal: journal.record_key(InputJournal.KIND_KEY_DOWN, key, self.mod_mask)
             k = self._normalize_key(key)
             if not k: return
             kid = self._get_key_id(key)
             if kid in self.active_keys: return 
-            self.active_keys[kid] = k; self.pressed_keys.add(k)
+            self.active_keys[kid] = k
+            self._request_drain() # ログを出さないキーでも、GUI 側でアクティブウィンドウ (プロファイル) を確かめさせる
+            if k not in self.pressed_keys: self._set_pressed(k, True)
             if k == 'Esc' and self.overlay_active:
                 self._timer_ctrl_signal.emit(False); self.cheat_overlay_signal.emit(False); self.overlay_active = False; return
             if self.cfg_cheat_enabled and k.upper() == self.cfg_cheat_key:
                 if not self.overlay_active: self._timer_ctrl_signal.emit(True)
             if self.cfg_log_enabled:
-                text, is_char_input = self._build_key_text()
-                if not text: return
+                event = self._build_key_event(t0)
+                if not event: return
+                text = event.text
+                chord = self.chord_matcher.feed(config.active_index.chords, text, t0)
+                if chord:
+                    strokes, chord_item = chord
+                    if not chord_item.get("show_in_log", True): return # 完成した連続ストロークはログ非表示なら最後のストロークも出さない
+                    desc = chord_item.get("desc", "") if self.cfg_cascadeur_mode else ""
+                    self._push_event((self.EV_LOG, InputEvent(InputAction.CHORD, keys=strokes, desc=desc, t_input=t0)), t0); return
+                if self._is_hidden_single_key(event): return
                 item = config.get_shortcut_item(text)
-                desc = item.get("desc") if item and self.cfg_cascadeur_mode else ""
+                if item and self.cfg_cascadeur_mode: event.desc = item.get("desc") or ""
                 show_in_log = item.get("show_in_log", True) if item else True
-                if show_in_log: self.key_signal.emit(text, desc, is_char_input)
+                if show_in_log: self._push_event((self.EV_LOG, event), t0); self._hold_keys = set(self.active_keys)
         except Exception:
              logging.error(f"Key Press Error: {traceback.format_exc()}")
 
     def on_release(self, key):
         try:
+            journal = self.journal
+            if journal: journal.record_key(InputJournal.KIND_KEY_UP, key, self.mod_mask)
             kid = self._get_key_id(key)
             released_k = None
             if kid in self.active_keys:
                 released_k = self.active_keys[kid]
-                if released_k in self.pressed_keys: self.pressed_keys.remove(released_k)
+                if released_k in self.pressed_keys: self._set_pressed(released_k, False)
                 del self.active_keys[kid]
             else:
                 k = self._normalize_key(key)
-                if k and k in self.pressed_keys: released_k = k; self.pressed_keys.remove(k)
+                if k and k in self.pressed_keys: released_k = k; self._set_pressed(k, False)
+            hold_keys = self._hold_keys
+            if hold_keys:
+                # A を押したまま B を叩いても A の固定は解かない。固定した組み合わせのキーが最後まで離された時だけ解除する
+                hold_keys.discard(kid)
+                if not hold_keys or not self.active_keys: hold_keys.clear(); self._push_event((self.EV_HOLD_END,))
             if released_k and self.cfg_cheat_enabled and released_k.upper() == self.cfg_cheat_key:
                 self._timer_ctrl_signal.emit(False) 
                 if self.just_activated_by_hold: self.just_activated_by_hold = False; return
@@ -831,6 +1717,242 @@ class InputWorker(QObject):
         except Exception:
              logging.error(f"Key Release Error: {traceback.format_exc()}")
 
+# --- 合成入力 (pynputのKey/KeyCode/Buttonを模したオブジェクト) ---
+class SyntheticKey:
+    # 列挙子が存在しない/別名に潰れる環境 (ダミーバックエンド等) 用の代替オブジェクト
+    __slots__ = ('prefix', 'name')
+    def __init__(self, name, prefix="Key"): self.prefix = prefix; self.name = name
+    def __str__(self): return f"{self.prefix}.{self.name}"
+    def __repr__(self): return f"<{self}>"
+    def __eq__(self, other): return isinstance(other, SyntheticKey) and other.prefix == self.prefix and other.name == self.name
+    def __hash__(self): return hash((self.prefix, self.name))
+
+def make_synthetic_key(name="", vk=0, char=0):
+    if name:
+        key = keyboard.Key.__members__.get(name)
+        return key if key is not None and key.name == name else SyntheticKey(name)
+    if char: return keyboard.KeyCode(vk=vk or None, char=chr(char))
+    return keyboard.KeyCode.from_vk(vk)
+
+def make_synthetic_button(name):
+    button = mouse.Button.__members__.get(name)
+    return button if button is not None and button.name == name else SyntheticKey(name, prefix="Button")
+
+# --- 入力リプレイ (記録したジャーナルを実際の入力経路に流し込む) ---
+class InputReplayer(QObject):
+    finished_signal = pyqtSignal(int)
+
+    def __init__(self, worker, records, speed=1.0):
+        super().__init__()
+        self.worker = worker; self.records = records
+        self.speed = speed # 1.0=実時間, N=N倍速, 0以下=待ち時間なしで最速
+        self._stop = threading.Event(); self._thread = None
+        self.dispatcher = RecordDispatcher(worker)
+
+    @staticmethod
+    def load_records(paths):
+        files = []
+        for p in paths:
+            p = Path(p)
+            files.extend(sorted(p.glob(InputJournal.FILE_PATTERN)) if p.is_dir() else [p])
+        records = []
+        for f in files: records.extend(InputJournal.read(f))
+        records.sort(key=lambda r: r[0])
+        return records
+
+    def start(self):
+        # 実際のフックと同様に、GUIスレッド以外から InputWorker を呼び出す
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="KeyGuideReplay", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread: self._thread.join(1.0)
+
+    def _wait_until(self, target):
+        delay = target - time.perf_counter()
+        if delay > 0.002: self._stop.wait(delay - 0.002) # OSタイマーの粒度を考慮し、最後の2msはスピンで合わせる
+        while time.perf_counter() < target and not self._stop.is_set(): pass
+
+    def _run(self):
+        played = 0
+        if self.records:
+            t0 = self.records[0][0]; start = time.perf_counter()
+            for record in self.records:
+                if self._stop.is_set(): break
+                if self.speed > 0: self._wait_until(start + (record[0] - t0) / self.speed)
+                self.dispatcher.dispatch(record); played += 1
+        self.finished_signal.emit(played)
+
+# --- ジャーナル形式のレコードを InputWorker のフック関数に戻す (リプレイ/別プロセスキャプチャ共通) ---
+class RecordDispatcher:
+    def __init__(self, worker):
+        self.worker = worker
+        self._keys = {}
+
+    def key(self, code, vk, char):
+        cache_key = (code, vk, char)
+        key = self._keys.get(cache_key)
+        if key is None:
+            name = InputJournal.KEY_NAMES[code] if code < len(InputJournal.KEY_NAMES) else ""
+            key = self._keys[cache_key] = make_synthetic_key(name, vk, char)
+        return key
+
+    def dispatch(self, record):
+        ts, kind, mods, code, vk, char, x, y, dx, dy = record
+        if kind == InputJournal.KIND_KEY_DOWN: self.worker.on_press(self.key(code, vk, char))
+        elif kind == InputJournal.KIND_KEY_UP: self.worker.on_release(self.key(code, vk, char))
+        elif kind in (InputJournal.KIND_CLICK_DOWN, InputJournal.KIND_CLICK_UP):
+            name = InputJournal.BUTTON_NAMES[code] if code < len(InputJournal.BUTTON_NAMES) else "unknown"
+            self.worker.on_click(x, y, make_synthetic_button(name), kind == InputJournal.KIND_CLICK_DOWN)
+        elif kind == InputJournal.KIND_SCROLL: self.worker.on_scroll(x, y, dx, dy)
+        elif kind == InputJournal.KIND_MOVE: self.worker.on_move(x, y)
+
+# --- 別プロセスでの入力キャプチャ (共有メモリのリングバッファで受け渡す) ---
+class SharedInputRing:
+    # 書き込み側は子プロセス1つ、読み出し側はGUIプロセスの受信スレッド1つ。満杯時は古いレコードを上書きする
+    HEADER = struct.Struct("<QIIII") # write_seq, waiting, capacity, forward_moves, move_pending
+    WAITING_OFFSET = 8; FORWARD_MOVES_OFFSET = 16; MOVE_PENDING_OFFSET = 20
+    RECORD = InputJournal.RECORD
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm; self.owner = owner; self.buf = shm.buf
+        self.capacity = self.HEADER.unpack_from(self.buf, 0)[2]
+        self.write_seq = self.HEADER.unpack_from(self.buf, 0)[0] # 子プロセス再起動時は続きから書く
+        self.read_seq = self.write_seq; self.dropped = 0
+
+    @classmethod
+    def create(cls, capacity):
+        capacity = max(16, int(capacity))
+        shm = shared_memory.SharedMemory(create=True, size=cls.HEADER.size + cls.RECORD.size * capacity)
+        cls.HEADER.pack_into(shm.buf, 0, 0, 0, capacity, 0, 0)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name): return cls(shared_memory.SharedMemory(name=name))
+
+    @property
+    def name(self): return self.shm.name
+
+    def push(self, kind, mods=0, code=0, vk=0, char=0, x=0, y=0, dx=0, dy=0):
+        # 戻り値: 読み出し側が待機中で、起こす必要があるか
+        seq = self.write_seq
+        self.RECORD.pack_into(self.buf, self.HEADER.size + (seq % self.capacity) * self.RECORD.size, time.time(), kind, mods, code, vk, char, x, y, dx, dy)
+        self.write_seq = seq + 1
+        struct.pack_into("<Q", self.buf, 0, seq + 1)
+        if struct.unpack_from("<I", self.buf, self.WAITING_OFFSET)[0]:
+            struct.pack_into("<I", self.buf, self.WAITING_OFFSET, 0); return True
+        return False
+
+    def pending(self): return struct.unpack_from("<Q", self.buf, 0)[0] != self.read_seq
+
+    # ポインタ移動は Halo が有効な時だけ、しかも未読の MOVE が無い時に1件だけ積む (位置は GUI 側が読む時点のものを使う)
+    # キーのための枠を移動で埋めず、アイドル中の受信スレッドを移動のたびに起こさないようにする
+    def set_forward_moves(self, enabled): struct.pack_into("<I", self.buf, self.FORWARD_MOVES_OFFSET, 1 if enabled else 0)
+
+    def claim_move(self):
+        # 子プロセス側: True なら MOVE を積んでよい
+        if not struct.unpack_from("<I", self.buf, self.FORWARD_MOVES_OFFSET)[0] or struct.unpack_from("<I", self.buf, self.MOVE_PENDING_OFFSET)[0]: return False
+        struct.pack_into("<I", self.buf, self.MOVE_PENDING_OFFSET, 1); return True
+
+    def set_waiting(self, waiting): struct.pack_into("<I", self.buf, self.WAITING_OFFSET, 1 if waiting else 0)
+
+    def drain(self):
+        struct.pack_into("<I", self.buf, self.MOVE_PENDING_OFFSET, 0) # 読む前に下ろすので、この後の移動は次の MOVE として積まれる
+        end = struct.unpack_from("<Q", self.buf, 0)[0]; start = self.read_seq
+        if end - start > self.capacity: self.dropped += end - self.capacity - start; start = end - self.capacity
+        self.read_seq = end
+        return [self.RECORD.unpack_from(self.buf, self.HEADER.size + (seq % self.capacity) * self.RECORD.size) for seq in range(start, end)]
+
+    def close(self):
+        self.buf = None; self.shm.close()
+        if self.owner:
+            try: self.shm.unlink()
+            except FileNotFoundError: pass
+
+def capture_process_main(ring_name, wake_conn, backend_name="pynput"):
+    # 子プロセス側: フックではレコードを書き込むだけにし、GUIの描画負荷の影響を受けないようにする
+    ring = SharedInputRing.attach(ring_name); lock = threading.Lock()
+    def push(*args, **kwargs):
+        with lock:
+            if ring.push(*args, **kwargs):
+                try: wake_conn.send_bytes(b"\x01")
+                except OSError: pass
+    def on_press(key): push(InputJournal.KIND_KEY_DOWN, 0, *InputJournal.encode_key(key))
+    def on_release(key): push(InputJournal.KIND_KEY_UP, 0, *InputJournal.encode_key(key))
+    def on_click(x, y, button, pressed):
+        push(InputJournal.KIND_CLICK_DOWN if pressed else InputJournal.KIND_CLICK_UP, 0, InputJournal.BUTTON_CODES.get(str(button).replace('Button.', ''), 0), x=int(x), y=int(y))
+    def on_scroll(x, y, dx, dy): push(InputJournal.KIND_SCROLL, 0, x=int(x), y=int(y), dx=int(dx), dy=int(dy))
+    def on_move(x, y):
+        if ring.claim_move(): push(InputJournal.KIND_MOVE, 0, x=int(x), y=int(y))
+    backend = open_input_backend(backend_name, on_press, on_release, on_click, on_scroll, on_move)
+    # 親プロセスが終了したら後を追う (ポーリングせずにプロセスの終了待ちで待機する)
+    mp_connection.wait([multiprocessing.parent_process().sentinel])
+    backend.stop(); ring.close()
+
+class CaptureProcess:
+    # GUIプロセス側: 子プロセスを起動・監視し、受信スレッドでリングを読み出して InputWorker に流す
+    RESTART_DELAY_MAX = 10.0
+
+    def __init__(self, worker, capacity=65536, backend_name="pynput"):
+        self.dispatcher = RecordDispatcher(worker); self.backend_name = backend_name
+        self.ring = SharedInputRing.create(capacity)
+        self.ctx = multiprocessing.get_context("spawn")
+        self.process = None; self.wake_conn = None
+        self._stop = threading.Event(); self._thread = None
+        self.restarts = 0
+        self.update_settings(); config.reload_signal.connect(self.update_settings)
+
+    def update_settings(self): self.ring.set_forward_moves(config.get("mouse_halo_enabled"))
+
+    def start(self):
+        self._spawn()
+        self._thread = threading.Thread(target=self._run, name="KeyGuideCaptureReader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set(); config.reload_signal.disconnect(self.update_settings)
+        if self.process and self.process.is_alive(): self.process.terminate()
+        if self._thread: self._thread.join(2.0)
+        if self.process: self.process.join(1.0)
+        if self.wake_conn: self.wake_conn.close()
+        self.ring.close()
+
+    def _spawn(self):
+        if self.wake_conn: self.wake_conn.close()
+        recv_conn, send_conn = self.ctx.Pipe(duplex=False)
+        self.process = self.ctx.Process(target=capture_process_main, args=(self.ring.name, send_conn, self.backend_name), name="KeyGuideCapture", daemon=True)
+        self.process.start()
+        send_conn.close() # 子が落ちたら受信側が EOF になるよう、親の送信端は閉じておく
+        self.wake_conn = recv_conn
+
+    def _run(self):
+        delay = 1.0
+        while not self._stop.is_set():
+            try:
+                records = self.ring.drain()
+                for record in records: self.dispatcher.dispatch(record)
+                if records: continue
+                self.ring.set_waiting(True)
+                if self.ring.pending(): continue
+                # 通知を取りこぼしても止まらないよう、待機には上限を設ける。ただしアイドル中は起きないよう上限なしで待つ
+                # (取りこぼしても待機フラグは立ったままなので、次の入力で子プロセスが起こしてくれる)
+                ready = mp_connection.wait([self.wake_conn, self.process.sentinel], timeout=None if idle.parked else 1.0)
+                idle.note_wakeup()
+                if self.wake_conn in ready:
+                    try:
+                        while self.wake_conn.poll(): self.wake_conn.recv_bytes()
+                    except (EOFError, OSError): pass
+                if self.process.is_alive() or self._stop.is_set(): delay = 1.0; continue
+                logging.error(f"Capture process exited (code {self.process.exitcode}), restarting")
+                if self._stop.wait(delay): break
+                delay = min(delay * 2, self.RESTART_DELAY_MAX); self.restarts += 1
+                self._spawn()
+            except Exception:
+                logging.error(f"Capture Reader Error: {traceback.format_exc()}")
+                if self._stop.wait(1.0): break
+
 # --- チートシート (Window) ---
 class CheatSheetWindow(QWidget):
     EDGE_NONE = 0; EDGE_LEFT = 1; EDGE_TOP = 2; EDGE_RIGHT = 3; EDGE_BOTTOM = 4
@@ -908,6 +2030,7 @@ class CheatSheetWindow(QWidget):
         self.main_layout.addWidget(self.content_widget)
 
         config.changed_signal.connect(self.update_content)
+        config.profile_changed_signal.connect(self.update_content)
         # 言語変更時にタイトル更新
         config.language_changed_signal.connect(self.update_content)
         self.update_content()
@@ -1066,7 +2189,7 @@ class CheatSheetWindow(QWidget):
         key_align = (Qt.AlignmentFlag.AlignRight if align_val == 1 else Qt.AlignmentFlag.AlignLeft) | Qt.AlignmentFlag.AlignVCenter
         do_wrap = config.get("cheat_sheet_word_wrap")
 
-        shortcuts = config.get("shortcuts_list")
+        shortcuts = config.get_active_shortcuts()
         items_to_show = [i for i in shortcuts if i.get("enabled") and i.get("show_in_cheat", True)]
         cr = 0
         for item in items_to_show:
@@ -1096,8 +2219,11 @@ class CheatSheetOverlay(QWidget):
         self.main_layout.addWidget(self.center_container)
         config.changed_signal.connect(self.refresh_style)
         config.language_changed_signal.connect(self.refresh_style)
+        config.profile_changed_signal.connect(self.on_profile_changed)
 
     def refresh_style(self, key=None, val=None): self.update()
+    def on_profile_changed(self, name):
+        if self.isVisible(): self.build_layout()
 
     def paintEvent(self, event):
         painter = QPainter(self)
@@ -1119,7 +2245,7 @@ class CheatSheetOverlay(QWidget):
             child = self.grid_layout.takeAt(0)
             if child.widget(): child.widget().deleteLater()
             elif child.layout(): pass
-        shortcuts = config.get("shortcuts_list")
+        shortcuts = config.get_active_shortcuts()
         items = [i for i in shortcuts if i.get("enabled") and i.get("show_in_cheat", True)]
         if not items: return
         screen_geo = QApplication.primaryScreen().geometry()
@@ -1244,56 +2370,218 @@ class ColorOpacityControl(QWidget):
         current_hex = config.get(self.key); c = QColor(current_hex); new_opacity = self.sb_opacity.value()
         new_alpha = int(round((new_opacity / 100.0) * 255)); c.setAlpha(new_alpha); new_hex = c.name(QColor.NameFormat.HexArgb); config.set(self.key, new_hex)
 
+# --- ログ項目の描画 (ウィジェット版と一枚描き版で共用) ---
+def make_log_font(prefix):
+    font = QFont(config.get(f"{prefix}_family"), config.get(f"{prefix}_size")); font.setBold(config.get(f"{prefix}_bold")); font.setItalic(config.get(f"{prefix}_italic")); font.setUnderline(config.get(f"{prefix}_underline")); font.setStrikeOut(config.get(f"{prefix}_strikeout"))
+    return font
+
+def log_text_style(prefix, color_key):
+    # OutlinedLabel.set_custom_style に渡す順 (縁取り有無, 幅, 色, 文字色, 影有無, 影色, 影X, 影Y)
+    return (config.get(f"{prefix}_outline_enabled"), config.get(f"{prefix}_outline_width"), config.get(f"{prefix}_outline_color"), config.get(color_key),
+            config.get(f"{prefix}_shadow_enabled"), config.get(f"{prefix}_shadow_color"), config.get(f"{prefix}_shadow_offset_x"), config.get(f"{prefix}_shadow_offset_y"))
+
+def paint_key_frame(painter, rect, bg_color, border_color, border_width, border_radius):
+    painter.setPen(Qt.PenStyle.NoPen)
+    outer = QPainterPath(); outer.addRoundedRect(QRectF(rect), border_radius, border_radius)
+    bw = border_width; r = max(0, border_radius - bw)
+    inner = QPainterPath(); inner.addRoundedRect(QRectF(rect).adjusted(bw, bw, -bw, -bw), r, r)
+    # 枠線は外形から内側を抜いた輪として塗り、背景と重ならないようにする
+    if bw > 0: painter.setBrush(border_color); painter.drawPath(outer.subtracted(inner))
+    painter.setBrush(bg_color); painter.drawPath(inner)
+
+def paint_separator(painter, x0, x1, y):
+    width = config.get("separator_width"); color = QColor(config.get("separator_color"))
+    if config.get("sep_shadow_enabled"):
+        shadow_color = QColor(config.get("sep_shadow_color")); offset_x = config.get("sep_shadow_offset_x"); offset_y = config.get("sep_shadow_offset_y")
+        shadow_pen = QPen(shadow_color, width); shadow_pen.setCapStyle(Qt.PenCapStyle.RoundCap)
+        painter.setPen(shadow_pen); painter.drawLine(int(x0 + offset_x), int(y + offset_y), int(x1 + offset_x), int(y + offset_y))
+    pen = QPen(color, width); pen.setCapStyle(Qt.PenCapStyle.RoundCap); painter.setPen(pen); painter.drawLine(int(x0), int(y), int(x1), int(y))
+
+def render_outlined_text(painter, x, y, font, text, outline_enabled, outline_width, outline_color, text_color, shadow_enabled, shadow_color, shadow_offset, path=None):
+    # y はベースライン。影 → 縁取り → 本体の順に重ねる
+    if path is None: path = QPainterPath(); path.addText(x, y, font, text)
+    if shadow_enabled:
+        painter.save(); painter.translate(shadow_offset); painter.setPen(Qt.PenStyle.NoPen); painter.setBrush(shadow_color); painter.drawPath(path); painter.restore()
+    if outline_enabled and outline_width > 0:
+        pen = QPen(outline_color, outline_width * 2); pen.setJoinStyle(Qt.PenJoinStyle.RoundJoin)
+        painter.setPen(pen); painter.setBrush(Qt.BrushStyle.NoBrush); painter.drawPath(path)
+    painter.setPen(Qt.PenStyle.NoPen); painter.setBrush(text_color); painter.drawPath(path)
+
+class TextSpriteCache:
+    # 縁取り・影付きの文字を画像にしておき、同じ文字・書式の再描画は貼るだけにする
+    # キーは (文字, フォント, 書式, デバイスピクセル比)。合計バイト数が上限を超えたら古い順に捨てる (LRU)
+    def __init__(self, max_bytes=16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()
+        self.bytes = 0; self.hits = 0; self.misses = 0
+
+    def get(self, font, text, style, dpr):
+        key = (text, font.key(), tuple(v.rgba() if isinstance(v, QColor) else (v.x(), v.y()) if isinstance(v, QPoint) else v for v in style), dpr)
+        entry = self.entries.get(key)
+        if entry is not None: self.entries.move_to_end(key); self.hits += 1; return entry
+        self.misses += 1; entry = self.render(font, text, style, dpr); self.entries[key] = entry
+        self.bytes += entry[1].width() * entry[1].height() * 4
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, (_, old) = self.entries.popitem(last=False); self.bytes -= old.width() * old.height() * 4
+        return entry
+
+    def render(self, font, text, style, dpr):
+        outline_enabled, outline_width, _, _, shadow_enabled, _, shadow_offset = style
+        path = QPainterPath(); path.addText(0, 0, font, text); bounds = path.boundingRect()
+        if outline_enabled and outline_width > 0: bounds.adjust(-outline_width, -outline_width, outline_width, outline_width)
+        if shadow_enabled: bounds = bounds.united(bounds.translated(QPointF(shadow_offset)))
+        # アンチエイリアスのにじみ分を1px足し、原点を整数に揃えて貼り付け位置がずれないようにする
+        left = math.floor(bounds.left()) - 1; top = math.floor(bounds.top()) - 1
+        width = math.ceil(bounds.right()) + 1 - left; height = math.ceil(bounds.bottom()) + 1 - top
+        pixmap = QPixmap(QSize(max(1, math.ceil(width * dpr)), max(1, math.ceil(height * dpr)))); pixmap.setDevicePixelRatio(dpr); pixmap.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(pixmap); painter.setRenderHint(QPainter.RenderHint.Antialiasing); painter.translate(-left, -top)
+        render_outlined_text(painter, 0, 0, font, text, *style, path=path); painter.end()
+        return QPoint(left, top), pixmap
+
+    def clear(self): self.entries.clear(); self.bytes = 0
+
+    def stats(self): return {"entries": len(self.entries), "bytes": self.bytes, "hits": self.hits, "misses": self.misses}
+
+text_cache = TextSpriteCache()
+
+class IconCache:
+    # マウス操作アイコンを表示サイズに縮小済みで持っておく。キーは (パス, 更新日時, サイズ, デバイスピクセル比)
+    # パスの存在確認と更新日時は初回だけ調べ、icon_paths / icon_size が変わるまでファイルシステムには触れない
+    def __init__(self):
+        self.pixmaps = {}
+        self.stamps = {} # パス -> 更新日時 (読めないファイルは None)
+        config.changed_signal.connect(self.on_config_changed)
+
+    def on_config_changed(self, key, value):
+        if key in ("icon_paths", "icon_size"): self.clear()
+
+    def clear(self): self.pixmaps.clear(); self.stamps.clear()
+
+    def get(self, path, size, dpr):
+        if not path: return None
+        if path not in self.stamps:
+            try: self.stamps[path] = os.path.getmtime(path)
+            except OSError: self.stamps[path] = None
+        mtime = self.stamps[path]
+        if mtime is None: return None
+        key = (path, mtime, size, dpr); pixmap = self.pixmaps.get(key)
+        if pixmap is None:
+            source = QPixmap(path)
+            if source.isNull(): self.stamps[path] = None; return None
+            side = max(1, round(size * dpr))
+            pixmap = source.scaled(side, side, Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation); pixmap.setDevicePixelRatio(dpr)
+            self.pixmaps[key] = pixmap
+        return pixmap
+
+icon_cache = IconCache()
+
+def paint_outlined_text(painter, x, y, font, text, *style):
+    # 縁取り・影の組み立ては初回だけ行い、以降はキャッシュした画像を1回貼るだけにする
+    if not text: return
+    origin, pixmap = text_cache.get(font, text, style, painter.device().devicePixelRatioF())
+    painter.drawPixmap(int(x) + origin.x(), int(y) + origin.y(), pixmap)
+
 # --- 軽量な区切り線 (PaintEventで描画) ---
+class KeyFrame(QFrame):
+    # KeyItem の背景と枠線。スタイルシートの代わりに自前で描き、不透明度を QPainter で掛ける
+    def __init__(self):
+        super().__init__(); self.opacity = 1.0; self.bg_color = QColor(0, 0, 0, 0); self.border_color = QColor(0, 0, 0, 0); self.border_width = 0; self.border_radius = 0
+    def set_frame_style(self, bg_color, border_color, border_width, border_radius):
+        self.bg_color = QColor(bg_color); self.border_color = QColor(border_color); self.border_width = border_width; self.border_radius = border_radius; self.update()
+    def set_opacity(self, opacity):
+        if opacity != self.opacity: self.opacity = opacity; self.update()
+    def paintEvent(self, event):
+        if self.opacity <= 0: return
+        painter = QPainter(self); painter.setRenderHint(QPainter.RenderHint.Antialiasing); painter.setOpacity(self.opacity)
+        paint_key_frame(painter, self.rect(), self.bg_color, self.border_color, self.border_width, self.border_radius)
+
+class IconLabel(QWidget):
+    def __init__(self, pixmap, size):
+        super().__init__(); self.pixmap = pixmap; self.opacity = 1.0; self.setFixedSize(size, size)
+    def set_opacity(self, opacity):
+        if opacity != self.opacity: self.opacity = opacity; self.update()
+    def paintEvent(self, event):
+        if self.opacity <= 0: return
+        painter = QPainter(self); painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform); painter.setOpacity(self.opacity); painter.drawPixmap(self.rect(), self.pixmap)
+
 class SeparatorLine(QWidget):
-    def __init__(self): super().__init__(); self.setFixedHeight(10); self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+    def __init__(self): super().__init__(); self.opacity = 1.0; self.setFixedHeight(10); self.setAttribute(Qt.WidgetAttribute.WA_TransparentForMouseEvents)
+    def set_opacity(self, opacity):
+        if opacity != self.opacity: self.opacity = opacity; self.update()
     def paintEvent(self, event):
-        if not config.get("separator_enabled"): return
-        painter = QPainter(self); painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-        width = config.get("separator_width"); color = QColor(config.get("separator_color")); y = self.height() / 2
-        if config.get("sep_shadow_enabled"):
-            shadow_color = QColor(config.get("sep_shadow_color")); offset_x = config.get("sep_shadow_offset_x"); offset_y = config.get("sep_shadow_offset_y")
-            shadow_pen = QPen(shadow_color, width); shadow_pen.setCapStyle(Qt.PenCapStyle.RoundCap)
-            painter.setPen(shadow_pen); painter.drawLine(int(offset_x), int(y + offset_y), int(self.width() + offset_x), int(y + offset_y))
-        pen = QPen(color, width); pen.setCapStyle(Qt.PenCapStyle.RoundCap); painter.setPen(pen); painter.drawLine(0, int(y), self.width(), int(y))
+        if not config.get("separator_enabled") or self.opacity <= 0: return
+        painter = QPainter(self); painter.setRenderHint(QPainter.RenderHint.Antialiasing); painter.setOpacity(self.opacity)
+        paint_separator(painter, 0, self.width(), self.height() / 2)
 
 # --- ラベル描画 ---
 class OutlinedLabel(QLabel):
     def __init__(self, text, parent=None):
         super().__init__(text, parent); self.outline_enabled = False; self.outline_width = 1; self.outline_color = QColor("black")
         self.text_color = QColor("white"); self.shadow_enabled = False; self.shadow_color = QColor("black"); self.shadow_offset = QPoint(2, 2)
-        self.use_custom_style = False; self.setStyleSheet("background: transparent;")
+        self.use_custom_style = False; self.opacity = 1.0; self.setStyleSheet("background: transparent;")
     def set_custom_style(self, enabled, o_enabled, o_width, o_color, t_color, s_enabled=False, s_color=None, s_offset_x=0, s_offset_y=0):
         self.use_custom_style = enabled; self.outline_enabled = o_enabled; self.outline_width = o_width
         self.outline_color = QColor(o_color); self.text_color = QColor(t_color)
         self.shadow_enabled = s_enabled; self.shadow_color = QColor(s_color) if s_color else QColor("black")
         self.shadow_offset = QPoint(s_offset_x, s_offset_y); self.update()
+    def set_opacity(self, opacity):
+        if opacity != self.opacity: self.opacity = opacity; self.update()
     def paintEvent(self, event):
         if not self.use_custom_style: super().paintEvent(event); return
-        painter = QPainter(self); painter.setRenderHint(QPainter.RenderHint.Antialiasing); font = self.font(); painter.setFont(font); metrics = QFontMetrics(font)
-        y = (self.height() + metrics.ascent() - metrics.descent()) // 2; path = QPainterPath(); path.addText(0, y, font, self.text())
-        if self.shadow_enabled:
-            painter.save(); painter.translate(self.shadow_offset); painter.setPen(Qt.PenStyle.NoPen); painter.setBrush(self.shadow_color); painter.drawPath(path); painter.restore()
-        if self.outline_enabled and self.outline_width > 0:
-            pen = QPen(self.outline_color, self.outline_width * 2); pen.setJoinStyle(Qt.PenJoinStyle.RoundJoin)
-            painter.setPen(pen); painter.setBrush(Qt.BrushStyle.NoBrush); painter.drawPath(path)
-        painter.setPen(Qt.PenStyle.NoPen); painter.setBrush(self.text_color); painter.drawPath(path)
+        if self.opacity <= 0: return
+        painter = QPainter(self); painter.setRenderHint(QPainter.RenderHint.Antialiasing); painter.setOpacity(self.opacity); font = self.font(); metrics = QFontMetrics(font)
+        y = (self.height() + metrics.ascent() - metrics.descent()) // 2
+        paint_outlined_text(painter, 0, y, font, self.text(), self.outline_enabled, self.outline_width, self.outline_color, self.text_color, self.shadow_enabled, self.shadow_color, self.shadow_offset)
 
 # --- キーアイテム ---
-class KeyItem(QWidget):
-    def __init__(self, text, desc, is_mod_pressed=False, is_char_input=False, parent=None):
+class LogEntry:
+    # KeyItem (ウィジェット版) と LogRecord (一枚描き版) 共通の、表示時間・フェード・固定表示の扱い
+    # 派生側は set_count / set_opacity / global_center を用意する。マウス接近による透過は ProximityService がまとめて計算する
+    def init_entry(self, event):
+        self.event = event; self.raw_text = event.text; self.count = 1; self.burst = event.burst; self.count_base = 0; self.t_input = 0.0; self.t_built = 0.0; self.pinned = False; self.opacity = 1.0; self.time_opacity = 1.0; self.prox_opacity = 1.0
+    def parse_content(self, event, dpr):
+        # マウス操作はイベントが持つボタン種別でアイコンを決め、修飾キー部分はビットマスクから引く
+        if not event.button: return "", None, event.text
+        mode = config.get("mod_mouse_display_mode") if event.mods else config.get("log_display_mode")
+        icon = icon_cache.get(config.get("icon_paths").get(event.button), config.get("icon_size"), dpr) if mode > 0 else None
+        if icon is not None: return MODIFIER_PREFIXES[event.mods], icon, "" if mode == 2 else event.label
+        return "", None, event.text
+    def count_text(self): return f"{self.base_main} x{self.count}" if self.base_main else f"x{self.count}"
+    def increment_count(self): self.set_count(self.count + 1)
+    def add_burst(self, event):
+        # バーストが途切れて数え直しになっても、表示中の件数は下げずにその上に積む
+        if event.burst != self.burst: self.burst = event.burst; self.count_base = self.count
+        self.set_count(self.count_base + event.count)
+    def reset_timer(self): self.start_ts = time.time(); self.time_opacity = 1.0; self.set_opacity(self.prox_opacity); frame_clock.add(self)
+    def set_prox_opacity(self, opacity):
+        # ProximityService から距離に応じた不透明度を受け取り、時間経過のフェードと掛け合わせる
+        if opacity != self.prox_opacity: self.prox_opacity = opacity; self.set_opacity(self.time_opacity * opacity)
+    def pin(self): self.pinned = True; self.reset_timer()
+    def unpin(self): self.pinned = False; self.reset_timer() # 離した時点から表示時間を数え直す
+    def advance(self, now):
+        clock = frame_clock; disp = clock.display_time; fade = clock.fade_duration
+        elapsed = 0 if self.pinned else (now - self.start_ts) * 1000
+        time_opacity = 1.0; next_due = None if self.pinned else self.start_ts + disp / 1000 # 表示維持中はフェード開始まで起こさない
+        if elapsed > disp:
+            if elapsed < disp + fade: time_opacity = 1.0 - ((elapsed - disp) / fade); next_due = now
+            else: time_opacity = 0.0; next_due = None
+        self.time_opacity = time_opacity; self.set_opacity(time_opacity * self.prox_opacity)
+        return next_due
+
+class KeyItem(LogEntry, QWidget):
+    def __init__(self, event, parent=None):
         super().__init__(parent)
-        self.raw_text = text; self.count = 1; self.is_mod_pressed = is_mod_pressed
+        self.init_entry(event); text = event.text; desc = event.desc; self.fade_layer = None
         self.main_layout = QVBoxLayout(self); self.main_layout.setContentsMargins(0, 0, 0, 0); self.main_layout.setAlignment(Qt.AlignmentFlag.AlignLeft)
-        self.frame = QFrame(); self.frame.setObjectName("keyFrame"); self.frame.setFrameShape(QFrame.Shape.StyledPanel)
+        self.frame = KeyFrame()
         self.content_layout = QVBoxLayout(self.frame); self.content_layout.setSpacing(2)
         self.key_row_widget = QWidget(); self.key_row_widget.setStyleSheet("background: transparent;")
         self.key_row_layout = QHBoxLayout(self.key_row_widget); self.key_row_layout.setContentsMargins(0,0,0,0); self.key_row_layout.setSpacing(4)
-        mod_text, icon_pixmap, main_text = self.parse_content(text, is_mod_pressed)
+        mod_text, icon_pixmap, main_text = self.parse_content(event, self.devicePixelRatioF()); self.base_main = main_text
         self.lbl_mods = None; self.icon_lbl = None; self.lbl_main = None
         if mod_text: self.lbl_mods = OutlinedLabel(mod_text); self.key_row_layout.addWidget(self.lbl_mods)
         if icon_pixmap:
-            self.icon_lbl = QLabel(); self.icon_lbl.setPixmap(icon_pixmap); self.icon_lbl.setFixedSize(config.get("icon_size"), config.get("icon_size")); self.icon_lbl.setScaledContents(True); self.icon_lbl.setStyleSheet("background: transparent;")
+            self.icon_lbl = IconLabel(icon_pixmap, config.get("icon_size"))
             self.key_row_layout.addWidget(self.icon_lbl)
         if main_text: self.lbl_main = OutlinedLabel(main_text); self.key_row_layout.addWidget(self.lbl_main)
         self.content_layout.addWidget(self.key_row_widget)
@@ -1303,67 +2591,133 @@ class KeyItem(QWidget):
             if config.get("separator_enabled"): self.line = SeparatorLine(); self.content_layout.addWidget(self.line)
             self.lbl_desc = OutlinedLabel(desc); self.content_layout.addWidget(self.lbl_desc)
         self.main_layout.addWidget(self.frame)
-        self.opacity_effect = QGraphicsOpacityEffect(self); self.opacity_effect.setOpacity(1.0); self.setGraphicsEffect(self.opacity_effect)
-        self.start_ts = time.time(); self.timer = QTimer(self); self.timer.timeout.connect(self.update_state); self.timer.start(30)
+        self.start_ts = time.time(); frame_clock.add(self); proximity.track(self)
         self.update_style(); self.update_font(); config.changed_signal.connect(self.on_config_changed)
-    def parse_content(self, text, is_mod):
-        if is_mod: mode = config.get("mod_mouse_display_mode")
-        else: mode = config.get("log_display_mode")
-        icon_paths = config.get("icon_paths"); aliases = config.get("mouse_aliases"); target_key = None
-        std_keys = [("Right Click", "right"), ("Left Click", "left"), ("Double Click", "left"), ("Middle Click", "middle"), ("Middle Drag", "middle"), ("Scroll", "middle")]
-        for std_name, key_type in std_keys:
-            alias_val = aliases.get(std_name, std_name)
-            if alias_val in text: target_key = key_type; break
-        pixmap = None; mod_part = ""; main_part = text
-        if target_key and icon_paths.get(target_key) and os.path.exists(icon_paths[target_key]):
-            if mode > 0:
-                pixmap = QPixmap(icon_paths[target_key])
-                if "+" in text:
-                    parts = text.rsplit("+", 1)
-                    if len(parts) == 2: mod_part = parts[0] + "+"; main_part = parts[1]
-                    else: mod_part = ""; main_part = text
-                else: mod_part = ""; main_part = text
-                if mode == 2: main_part = ""
-        if mod_part == text and main_part == text: mod_part = ""
-        return mod_part, pixmap, main_part
-    def increment_count(self):
-        self.count += 1; _, _, base_main = self.parse_content(self.raw_text, self.is_mod_pressed)
-        disp_text = f"{base_main} x{self.count}" if base_main else f"x{self.count}"
+        if event.count > 1: self.set_count(event.count)
+    def set_count(self, count):
+        self.count = count; disp_text = self.count_text()
         if self.lbl_main: self.lbl_main.setText(disp_text)
         elif not self.lbl_main: self.lbl_main = OutlinedLabel(disp_text); self.key_row_layout.addWidget(self.lbl_main); self.update_style()
+        self.refresh_fade_layer() # フェード中は表示中の画像を新しい回数で描き直す
         self.reset_timer()
-    def on_config_changed(self, key, value): self.update_style(); self.update_font()
-    def reset_timer(self): self.start_ts = time.time(); self.opacity_effect.setOpacity(1.0); self.timer.start(30)
+    def on_config_changed(self, key, value): self.update_style(); self.update_font(); self.refresh_fade_layer()
+    def paintEvent(self, event):
+        if self.t_input:
+            now = time.perf_counter(); latency.add("paint", now - self.t_built); latency.add("total", now - self.t_input); self.t_input = 0.0
+        if self.fade_layer is not None and self.opacity > 0:
+            painter = QPainter(self); painter.setOpacity(self.opacity); painter.drawPixmap(self.frame.geometry().topLeft(), self.fade_layer)
+    def resizeEvent(self, event): super().resizeEvent(event); self.refresh_fade_layer(); proximity.invalidate()
+    def moveEvent(self, event): super().moveEvent(event); proximity.invalidate()
+    def global_center(self): return self.mapToGlobal(self.rect().center()) if self.isVisible() else None
+    def set_opacity(self, opacity):
+        # フェード中は不透明で1度だけ描いた画像を QPainter.setOpacity で重ねる (毎ステップ子ウィジェットを画面外で再合成しない)
+        # 影・縁取り・背景の重なりも含めて全体に不透明度が掛かるので、QGraphicsOpacityEffect と同じ見た目になる
+        if opacity == self.opacity: return
+        if opacity >= 1.0: self.fade_layer = None; self._set_children_opacity(1.0)
+        elif self.fade_layer is None: self._render_fade_layer()
+        self.opacity = opacity; self.update()
+    def _set_children_opacity(self, opacity):
+        for w in (self.frame, self.lbl_mods, self.icon_lbl, self.lbl_main, self.line, self.lbl_desc):
+            if w: w.set_opacity(opacity)
+    def _render_fade_layer(self):
+        self._set_children_opacity(1.0)
+        dpr = self.devicePixelRatioF(); size = self.frame.size()
+        layer = QPixmap(QSize(max(1, math.ceil(size.width() * dpr)), max(1, math.ceil(size.height() * dpr)))); layer.setDevicePixelRatio(dpr); layer.fill(Qt.GlobalColor.transparent)
+        self.frame.render(layer, QPoint(0, 0), QRegion(), QWidget.RenderFlag.DrawChildren)
+        self.fade_layer = layer; self._set_children_opacity(0.0) # 子ウィジェットは描かず、画像だけを表示する
+    def refresh_fade_layer(self):
+        if self.fade_layer is not None: self._render_fade_layer(); self.update()
     def update_style(self):
-        bg_col = QColor(config.get("bg_color")); bg_css = f"rgba({bg_col.red()},{bg_col.green()},{bg_col.blue()},{bg_col.alpha()/255:.2f})"
-        self.frame.setStyleSheet(f"#keyFrame {{ background-color: {bg_css}; border: {config.get('border_width')}px solid {config.get('border_color')}; border-radius: {config.get('border_radius')}px; }} QLabel {{ background: transparent; }}")
-        pad_x = config.get("padding_x"); pad_y = config.get("padding_y"); self.frame.layout().setContentsMargins(pad_x, pad_y, pad_x, pad_y)
-        def apply_style(lbl, key_prefix="text"):
-            if not lbl: return
-            lbl.set_custom_style(True, config.get(f"{key_prefix}_outline_enabled"), config.get(f"{key_prefix}_outline_width"), config.get(f"{key_prefix}_outline_color"), config.get(f"{key_prefix}_color"), config.get(f"{key_prefix}_shadow_enabled"), config.get(f"{key_prefix}_shadow_color"), config.get(f"{key_prefix}_shadow_offset_x"), config.get(f"{key_prefix}_shadow_offset_y"))
-        apply_style(self.lbl_main, "text"); apply_style(self.lbl_mods, "text")
-        if self.lbl_desc:
-            self.lbl_desc.set_custom_style(True, config.get("desc_outline_enabled"), config.get("desc_outline_width"), config.get("desc_outline_color"), config.get("desc_text_color"), config.get("desc_shadow_enabled"), config.get("desc_shadow_color"), config.get("desc_shadow_offset_x"), config.get("desc_shadow_offset_y"))
+        border_w = config.get("border_width"); self.frame.set_frame_style(config.get("bg_color"), config.get("border_color"), border_w, config.get("border_radius"))
+        pad_x = config.get("padding_x") + border_w; pad_y = config.get("padding_y") + border_w; self.frame.layout().setContentsMargins(pad_x, pad_y, pad_x, pad_y)
+        text_style = log_text_style("text", "text_color")
+        if self.lbl_main: self.lbl_main.set_custom_style(True, *text_style)
+        if self.lbl_mods: self.lbl_mods.set_custom_style(True, *text_style)
+        if self.lbl_desc: self.lbl_desc.set_custom_style(True, *log_text_style("desc", "desc_text_color"))
         if self.line:
             sep_w = config.get("separator_width"); sep_sp = config.get("separator_spacing"); self.line.setFixedHeight(sep_w + sep_sp * 2); self.line.update() 
         self.update()
     def update_font(self):
-        font = QFont(config.get("font_family"), config.get("font_size")); font.setBold(config.get("font_bold")); font.setItalic(config.get("font_italic")); font.setUnderline(config.get("font_underline")); font.setStrikeOut(config.get("font_strikeout"))
+        font = make_log_font("font")
         if self.lbl_main: self.lbl_main.setFont(font)
         if self.lbl_mods: self.lbl_mods.setFont(font)
-        if self.lbl_desc:
-            desc_font = QFont(config.get("desc_font_family"), config.get("desc_font_size")); desc_font.setBold(config.get("desc_font_bold")); desc_font.setItalic(config.get("desc_font_italic")); desc_font.setUnderline(config.get("desc_font_underline")); desc_font.setStrikeOut(config.get("desc_font_strikeout")); self.lbl_desc.setFont(desc_font)
-    def update_state(self):
-        elapsed = (time.time() - self.start_ts) * 1000; disp = config.get("display_time"); fade = config.get("fade_duration")
-        time_opacity = 1.0
-        if elapsed > disp:
-            if elapsed < disp + fade: time_opacity = 1.0 - ((elapsed - disp) / fade)
-            else: time_opacity = 0.0; self.timer.stop()
-        prox_opacity = 1.0
-        if config.get("item_proximity_enabled") and self.isVisible():
-            cursor_pos = QCursor.pos(); center_glob = self.mapToGlobal(self.rect().center()); dist = math.sqrt((cursor_pos.x() - center_glob.x())**2 + (cursor_pos.y() - center_glob.y())**2); thresh = config.get("item_proximity_dist"); min_op = config.get("item_proximity_min_opacity")
-            if dist < thresh: ratio = dist / thresh; prox_opacity = min_op + (1.0 - min_op) * ratio; prox_opacity = max(min_op, min(1.0, prox_opacity))
-        self.opacity_effect.setOpacity(time_opacity * prox_opacity)
+        if self.lbl_desc: self.lbl_desc.setFont(make_log_font("desc_font"))
+
+class LogStyle:
+    # 一枚描きのログ用に、設定から作るフォント・色・余白を設定変更時に1回だけ用意しておく
+    # 見た目に関わる設定 (update と bake が読むもの)。これが変わった時だけ作り直して表示中の項目を焼き直す
+    KEYS = ("font_family", "font_size", "font_bold", "font_italic", "font_underline", "font_strikeout",
+            "desc_font_family", "desc_font_size", "desc_font_bold", "desc_font_italic", "desc_font_underline", "desc_font_strikeout",
+            "text_color", "text_outline_enabled", "text_outline_width", "text_outline_color",
+            "text_shadow_enabled", "text_shadow_color", "text_shadow_offset_x", "text_shadow_offset_y",
+            "desc_text_color", "desc_outline_enabled", "desc_outline_width", "desc_outline_color",
+            "desc_shadow_enabled", "desc_shadow_color", "desc_shadow_offset_x", "desc_shadow_offset_y",
+            "bg_color", "border_color", "border_width", "border_radius", "padding_x", "padding_y", "icon_size", "show_desc", "cascadeur_mode",
+            "separator_enabled", "separator_color", "separator_width", "separator_spacing",
+            "sep_shadow_enabled", "sep_shadow_color", "sep_shadow_offset_x", "sep_shadow_offset_y")
+    def __init__(self): self.update()
+    def update(self):
+        self.font = make_log_font("font"); self.desc_font = make_log_font("desc_font")
+        # 文字の寸法は QLabel.sizeHint と同じ QFontMetrics.size で測り、ベースラインは OutlinedLabel と同じ式で求める
+        self.metrics = fm = QFontMetrics(self.font); self.desc_metrics = dfm = QFontMetrics(self.desc_font)
+        self.text_height = fm.size(0, " ").height(); self.desc_height = dfm.size(0, " ").height(); self.text_rise = fm.ascent() - fm.descent(); self.desc_rise = dfm.ascent() - dfm.descent()
+        self.bg_color = QColor(config.get("bg_color")); self.border_color = QColor(config.get("border_color")); self.border_width = config.get("border_width"); self.border_radius = config.get("border_radius")
+        self.pad_x = config.get("padding_x") + self.border_width; self.pad_y = config.get("padding_y") + self.border_width
+        self.text_style = self.paint_style(log_text_style("text", "text_color")); self.desc_style = self.paint_style(log_text_style("desc", "desc_text_color"))
+        self.icon_size = config.get("icon_size"); self.show_desc = config.get("show_desc"); self.cascadeur_mode = config.get("cascadeur_mode")
+        self.separator_height = config.get("separator_width") + config.get("separator_spacing") * 2 if config.get("separator_enabled") else 0
+    @staticmethod
+    def paint_style(style):
+        o_enabled, o_width, o_color, t_color, s_enabled, s_color, s_x, s_y = style
+        return (o_enabled, o_width, QColor(o_color), QColor(t_color), s_enabled, QColor(s_color), QPoint(s_x, s_y))
+
+class LogRecord(LogEntry):
+    # 一枚描きモードのログ1件。ウィジェットは作らず、寸法を1回だけ測って画像に焼いておき、OverlayWindow.paintEvent で貼るだけにする
+    KEY_SPACING = 4; ROW_SPACING = 2 # KeyItem のレイアウトと同じ間隔
+    def __init__(self, event, overlay):
+        self.init_entry(event); self.overlay = overlay; self.rect = None
+        self.mod_text, self.icon, self.main_text = self.parse_content(event, overlay.devicePixelRatioF()); self.base_main = self.main_text
+        self.desc = event.desc or (config.get_shortcut_desc(event.text) if overlay.log_style.cascadeur_mode else "")
+        if event.count > 1: self.count = event.count; self.main_text = self.count_text()
+        self.relayout(); self.start_ts = time.time(); frame_clock.add(self); proximity.track(self)
+    def relayout(self):
+        # 寸法だけをここで測る。画像は次の paintEvent で1回だけ焼く (同じフレーム内の連打で何度も描き直さない)
+        style = self.overlay.log_style; spacing = self.KEY_SPACING
+        parts = [(text, style.metrics.size(0, text).width()) for text in (self.mod_text, self.main_text) if text]
+        if self.icon: parts.insert(1 if self.mod_text else 0, (self.icon, style.icon_size))
+        row_w = sum(w for _, w in parts) + spacing * max(0, len(parts) - 1)
+        row_h = max(style.text_height if self.mod_text or self.main_text else 0, style.icon_size if self.icon else 0)
+        show_desc = bool(self.desc and style.show_desc); sep_h = style.separator_height if show_desc else 0
+        content_w = max(row_w, style.desc_metrics.size(0, self.desc).width() if show_desc else 0)
+        content_h = row_h + (self.ROW_SPACING + sep_h if sep_h else 0) + (self.ROW_SPACING + style.desc_height if show_desc else 0)
+        self.parts = parts; self.row_h = row_h; self.content_w = content_w; self.sep_h = sep_h; self.show_desc = show_desc
+        self.width = content_w + style.pad_x * 2; self.height = content_h + style.pad_y * 2; self.pixmap = None
+    def bake(self):
+        style = self.overlay.log_style; w = self.width; h = self.height; row_h = self.row_h; dpr = self.overlay.devicePixelRatioF()
+        pixmap = QPixmap(QSize(max(1, math.ceil(w * dpr)), max(1, math.ceil(h * dpr)))); pixmap.setDevicePixelRatio(dpr); pixmap.fill(Qt.GlobalColor.transparent)
+        painter = QPainter(pixmap); painter.setRenderHint(QPainter.RenderHint.Antialiasing); painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform)
+        paint_key_frame(painter, QRect(0, 0, w, h), style.bg_color, style.border_color, style.border_width, style.border_radius)
+        x = style.pad_x; y = style.pad_y
+        for part, part_w in self.parts:
+            if isinstance(part, str): paint_outlined_text(painter, x, y + (row_h + style.text_rise) // 2, style.font, part, *style.text_style)
+            else: painter.drawPixmap(QRect(x, y + (row_h - part_w) // 2, part_w, part_w), part)
+            x += part_w + self.KEY_SPACING
+        y += row_h
+        if self.sep_h: y += self.ROW_SPACING; paint_separator(painter, style.pad_x, style.pad_x + self.content_w, y + self.sep_h / 2); y += self.sep_h
+        if self.show_desc: y += self.ROW_SPACING; paint_outlined_text(painter, style.pad_x, y + (style.desc_height + style.desc_rise) // 2, style.desc_font, self.desc, *style.desc_style)
+        painter.end()
+        self.pixmap = pixmap
+    def set_count(self, count):
+        old_rect = self.rect; self.count = count; self.main_text = self.count_text(); self.relayout(); self.overlay.stack_records()
+        # 高さが変わらなければ他の項目は動かないので、この項目の範囲だけ描き直す
+        if old_rect is not None and old_rect.height() == self.height: self.overlay.update(old_rect.united(self.rect))
+        else: self.overlay.update()
+        self.reset_timer()
+    def set_opacity(self, opacity):
+        if opacity == self.opacity: return
+        self.opacity = opacity
+        if self.rect is not None: self.overlay.update(self.rect)
+    def global_center(self): return self.overlay.mapToGlobal(self.rect.center()) if self.rect is not None and self.overlay.isVisible() else None
 
 class OverlayWindow(QWidget):
     def __init__(self):
@@ -1371,40 +2725,122 @@ class OverlayWindow(QWidget):
         self.setWindowFlags(Qt.WindowType.FramelessWindowHint | Qt.WindowType.WindowStaysOnTopHint | Qt.WindowType.Tool | Qt.WindowType.WindowTransparentForInput)
         self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground); self.setAttribute(Qt.WidgetAttribute.WA_ShowWithoutActivating)
         self.layout = QVBoxLayout(self); self.layout.setAlignment(Qt.AlignmentFlag.AlignBottom | Qt.AlignmentFlag.AlignLeft); self.layout.setSpacing(5)
-        self.items = []; self.update_geometry(); config.changed_signal.connect(self.on_config_changed)
+        self.layout.setSizeConstraint(QLayout.SizeConstraint.SetNoConstraint) # ウィンドウの大きさは update_geometry で中身に合わせる
+        self.items = []; self.held_item = None; self.storm_item = None; self.painted = config.get("log_renderer") == "painted"; self.log_style = LogStyle()
+        self.update_geometry(); config.changed_signal.connect(self.on_config_changed)
     def on_config_changed(self, key, value):
         if key in ["pos_x", "pos_y", "window_width"]: self.update_geometry()
-    def update_geometry(self): x = config.get("pos_x"); y_bottom = config.get("pos_y"); w = config.get("window_width"); h = 1000; self.setGeometry(x, y_bottom - h, w, h)
-    def add_key(self, text, desc="", is_mod_pressed=False, is_char_input=False):
+        if key == "log_renderer": self.set_renderer(value == "painted")
+        elif self.painted and key in LogStyle.KEYS:
+            # 一枚描きの項目は設定から作った画像を持っているので、見た目に関わる変更で焼き直す
+            self.log_style.update()
+            for rec in self.items: rec.relayout()
+            self.stack_records(); self.update()
+    def set_renderer(self, painted):
+        if painted == self.painted: return
+        for item in self.items: self._remove_item(item)
+        self.items = []; self.painted = painted; self.log_style.update(); self.update_geometry(); self.update()
+    def update_geometry(self):
+        # 表示中の項目を囲む大きさだけのウィンドウにして、左下を pos_x / pos_y に合わせる (幅は window_width まで。空の時は1px)
+        # 半透明の最前面ウィンドウは合成時に全面をブレンドされるので、余白の分だけ無駄になる
+        if not self.items: w = h = 1
+        elif self.painted:
+            margins = self.layout.contentsMargins()
+            w = max(rec.rect.right() for rec in self.items) + 1 + margins.right(); h = self.items[-1].rect.bottom() + 1 + margins.bottom()
+        else: hint = self.layout.sizeHint(); w = hint.width(); h = hint.height()
+        w = min(w, config.get("window_width")); geometry = QRect(config.get("pos_x"), config.get("pos_y") - h, w, h)
+        if geometry != self.geometry(): self.setGeometry(geometry)
+    def event(self, event):
+        handled = super().event(event)
+        # ウィジェット版は項目の追加・削除・文字の変化でレイアウトが組み直されるたびに大きさを合わせる
+        if event.type() == QEvent.Type.LayoutRequest and not self.painted: self.update_geometry()
+        return handled
+    def add_key(self, event):
+        t_start = time.perf_counter(); t_input = event.t_input
+        if t_input: latency.add("queue", t_start - t_input)
+        if event.action == InputAction.CHORD:
+            # 連続ストロークが完成したら、直前に表示していた前段ストロークの項目を置き換える
+            # ストロークの間で修飾キーを離して押し直した時の修飾キーだけの項目 (Ctrl+K → Ctrl → Ctrl+C の Ctrl) も飛ばさず取り除く
+            strokes = event.keys[:-1]; stroke_mods = 0
+            for stroke in event.keys: stroke_mods |= sum(MODIFIER_BITS.get(part, 0) for part in set(stroke.split("+")))
+            while self.items and self.items[-1].opacity > 0:
+                prev = self.items[-1].event
+                is_mod_only = prev.action == InputAction.KEY and not prev.keys and not prev.mods & ~stroke_mods
+                if self.items[-1].raw_text not in strokes and not is_mod_only: break
+                self._remove_item(self.items.pop())
+        storm = self.storm_item
+        if event.action == InputAction.STORM and storm is not None and storm.opacity > 0:
+            # ストーム中のスクロールが上に積まれても、表示中のストーム項目をその位置のまま数え足す (フレームごとに項目を作らない)
+            storm.add_burst(event); return
         if self.items:
-            last = self.items[-1]; last_parts = set(last.raw_text.split('+')); curr_parts = set(text.split('+'))
-            if last_parts < curr_parts and last.opacity_effect.opacity() > 0: self.layout.removeWidget(last); last.deleteLater(); self.items.pop()
+            last = self.items[-1]
+            if event.extends(last.event) and last.opacity > 0: self._remove_item(self.items.pop())
         if self.items:
             last = self.items[-1]
-            if last.raw_text == text and last.opacity_effect.opacity() > 0:
-                if (time.time() - last.start_ts) * 1000 < config.get("combo_timeout"):
-                    if "Scroll" in text: last.reset_timer()
-                    else: last.increment_count()
-                    return
-        item = KeyItem(text, desc, is_mod_pressed, is_char_input)
-        self.items.append(item); self.layout.addWidget(item)
-        while len(self.items) > config.get("max_stack"): old = self.items.pop(0); self.layout.removeWidget(old); old.deleteLater()
-    def maintain_key(self, text):
-        for item in reversed(self.items):
-            try: 
-                if item.raw_text == text: item.reset_timer(); return
-            except: pass
+            if last.event.same_as(event) and last.opacity > 0:
+                # スクロールはバースト中の合計ノッチ数で同じ項目をその場で更新する
+                if event.action in (InputAction.SCROLL, InputAction.STORM): last.add_burst(event); return
+                if (time.time() - last.start_ts) * 1000 < config.get("combo_timeout"): last.increment_count(); self._track_hold(last, event); return
+        item = LogRecord(event, self) if self.painted else KeyItem(event)
+        if t_input: item.t_input = t_input; item.t_built = time.perf_counter(); latency.add("build", item.t_built - t_start)
+        if event.action == InputAction.STORM: self.storm_item = item
+        self._append_item(item); self._track_hold(item, event)
+    def _append_item(self, item):
+        self.items.append(item)
+        if self.painted: self.stack_records(); self.update()
+        else: self.layout.addWidget(item)
+        while len(self.items) > config.get("max_stack"): self._remove_item(self.items.pop(0))
+    def _remove_item(self, item):
+        if item is self.held_item: self.held_item = None
+        if item is self.storm_item: self.storm_item = None
+        frame_clock.remove(item); proximity.untrack(item)
+        if self.painted: self.stack_records(); self.update()
+        else: self.layout.removeWidget(item); item.deleteLater()
+    def stack_records(self):
+        # 一枚描きモード: レイアウトと同じ余白・間隔で古い順に上から積み、ウィンドウをその外接矩形に合わせる
+        margins = self.layout.contentsMargins(); spacing = self.layout.spacing(); y = margins.top()
+        for rec in self.items: rec.rect = QRect(margins.left(), y, rec.width, rec.height); y += rec.height + spacing
+        self.update_geometry(); proximity.invalidate()
+    def moveEvent(self, event): super().moveEvent(event); proximity.invalidate()
+    def showEvent(self, event): super().showEvent(event); proximity.invalidate()
+    def hideEvent(self, event): super().hideEvent(event); proximity.invalidate()
+    def paintEvent(self, event):
+        # 一枚描きモード: 各項目の画像を、積んだ位置に不透明度付きで貼る
+        if not self.painted or not self.items: return
+        painter = QPainter(self); dirty = event.rect(); now = None
+        for rec in self.items:
+            if rec.rect is None or rec.opacity <= 0 or not dirty.intersects(rec.rect): continue
+            if rec.pixmap is None: rec.bake()
+            painter.setOpacity(rec.opacity); painter.drawPixmap(rec.rect.topLeft(), rec.pixmap)
+            if rec.t_input:
+                now = now or time.perf_counter(); latency.add("paint", now - rec.t_built); latency.add("total", now - rec.t_input); rec.t_input = 0.0
+    def _track_hold(self, item, event):
+        # キー入力の項目は離されるまで固定し、参照を持っておいて解放時に直接解除する
+        if event.action != InputAction.KEY: return
+        if self.held_item is not None and self.held_item is not item: self.held_item.unpin()
+        self.held_item = item; item.pin()
+    def release_hold(self):
+        if self.held_item is not None: self.held_item.unpin(); self.held_item = None
+    def add_batch(self, batch):
+        # 1フレーム分の入力をまとめて反映し、レイアウト計算は最後に1回だけ行う
+        # 再描画は update() が次のイベントループで1回にまとめるので、setUpdatesEnabled で止めない (戻す時にウィンドウ全体が再描画され、変わった範囲だけの再描画にならない)
+        for event in batch: self.add_key(event)
+        if not self.painted: self.layout.activate(); self.update_geometry()
     def clean_up(self):
         active_items = []
         for item in self.items:
             try:
-                if item.opacity_effect.opacity() <= 0.01: self.layout.removeWidget(item); item.deleteLater()
+                if item.opacity <= 0.01: self._remove_item(item)
                 else: active_items.append(item)
             except: pass
-        self.items = active_items
+        changed = len(active_items) != len(self.items); self.items = active_items
+        if changed and self.painted: self.stack_records() # 消えた項目の分を詰めてウィンドウを縮める
 
-# --- マウスHalo (修正版: タイマーポーリング + ToolTip) ---
+# --- マウスHalo (入力フックの移動通知で追従 + ToolTip) ---
 class MouseHalo(QWidget):
+    # 見た目に関わる設定。これが変わった時だけ状態ごとの画像を作り直す
+    SPRITE_KEYS = ("halo_size", "halo_color", "click_left_color", "click_right_color", "click_middle_color",
+                   "scroll_arrow_color", "scroll_arrow_size", "action_symbol_scale", "middle_click_square_size")
     def __init__(self):
         super().__init__()
         # 修正: ToolTipフラグでタスクバーより手前に表示
@@ -1412,11 +2848,13 @@ class MouseHalo(QWidget):
         self.setAttribute(Qt.WidgetAttribute.WA_TranslucentBackground); self.setAttribute(Qt.WidgetAttribute.WA_ShowWithoutActivating)
         
         self.left_pressed = False; self.right_pressed = False; self.middle_pressed = False; self.scroll_dy = 0
-        self.scroll_timer = QTimer(self); self.scroll_timer.setInterval(500); self.scroll_timer.timeout.connect(self.reset_scroll)
-        
-        self.pos_timer = QTimer(self)
-        self.pos_timer.setInterval(16) # 約60FPS
-        self.pos_timer.timeout.connect(self.update_pos)
+        self.scroll_timer = QTimer(self); self.scroll_timer.setSingleShot(True); self.scroll_timer.setInterval(500); self.scroll_timer.timeout.connect(self.reset_scroll)
+        # 位置の追従は InputWorker.halo_move_signal (1フレームに1回まで) で行い、ポインタが止まっている間は何もしない
+        self.moves = 0; self.raises = 0; self.restack_pending = True
+        self.cursor_source = QCursor.pos # リプレイ時は InputWorker.pointer_point に差し替えて、記録された座標を追う
+        self.sprites = {}; self.sprite_settings = None; self.sprite_renders = 0 # (状態, デバイスピクセル比) -> 描画済みの画像
+        # focusWindowChanged は自アプリのウィンドウ間でしか来ないので、他アプリの切り替えは前面ウィンドウの通知 (Windows) で拾う
+        QApplication.instance().focusWindowChanged.connect(self.restack); config.foreground_changed_signal.connect(self.restack)
         
         self.update_settings()
         config.changed_signal.connect(lambda k,v: self.update_settings())
@@ -1428,48 +2866,75 @@ class MouseHalo(QWidget):
         self.s_arrow_size = config.get("scroll_arrow_size"); self.symbol_scale = config.get("action_symbol_scale")
         self.offset_x = config.get("halo_offset_x"); self.offset_y = config.get("halo_offset_y")
         self.middle_sq_size = config.get("middle_click_square_size")
+        self.enabled = config.get("mouse_halo_enabled")
+        sprite_settings = tuple(config.get(k) for k in self.SPRITE_KEYS)
+        if sprite_settings != self.sprite_settings: self.sprite_settings = sprite_settings; self.sprites.clear()
         
-        if config.get("mouse_halo_enabled"):
-            self.pos_timer.start()
+        if self.enabled:
             self.show()
+            self.follow_cursor()
         else:
-            self.pos_timer.stop()
             self.hide()
             
         self.update()
 
-    def update_pos(self):
-        if not config.get("mouse_halo_enabled"):
+    def follow_cursor(self):
+        if not self.enabled:
             return
         
-        cursor = QCursor.pos()
-        self.move(cursor.x() - self.width() // 2 + self.offset_x, 
-                  cursor.y() - self.height() // 2 + self.offset_y)
+        cursor = self.cursor_source()
+        if cursor is None: return
+        target = QPoint(cursor.x() - self.width() // 2 + self.offset_x, 
+                        cursor.y() - self.height() // 2 + self.offset_y)
         
         if self.isHidden():
             self.show()
-        self.raise_()
+        if target != self.pos():
+            self.move(target); self.moves += 1
+        # 最前面に戻すのは重なり順が変わり得た時 (表示直後・クリック後・アクティブウィンドウの切り替え) だけ
+        if self.restack_pending:
+            self.restack_pending = False; self.raise_(); self.raises += 1
+
+    def restack(self, *args):
+        self.restack_pending = True
+        if self.enabled and not self.isHidden(): self.follow_cursor()
+
+    def showEvent(self, event): super().showEvent(event); self.restack_pending = True
 
     def set_click(self, btn, pressed):
         if btn == 'left': self.left_pressed = pressed
         elif btn == 'right': self.right_pressed = pressed
         elif btn == 'middle': self.middle_pressed = pressed
+        # クリックで他のウィンドウ (タスクバー等) が前に出るので、離した時に前面へ戻す
+        if not pressed: self.restack()
         self.update()
     def set_scroll(self, dy): self.scroll_dy = dy; self.scroll_timer.start(); self.update()
-    def reset_scroll(self): self.scroll_dy = 0; self.scroll_timer.stop(); self.update()
+    def reset_scroll(self): self.scroll_dy = 0; self.scroll_timer.stop(); idle.note_wakeup(); self.update()
+    def state(self):
+        # 表示の組み合わせ: 左, 右, スクロール方向 (-1/0/1), 中 (スクロール矢印が優先)
+        scroll = (self.scroll_dy > 0) - (self.scroll_dy < 0)
+        return (self.left_pressed, self.right_pressed, scroll, self.middle_pressed and not scroll)
+    def sprite(self, state):
+        dpr = self.devicePixelRatioF(); key = (state, dpr); pixmap = self.sprites.get(key)
+        if pixmap is None:
+            pixmap = QPixmap(QSize(math.ceil(self.width() * dpr), math.ceil(self.height() * dpr))); pixmap.setDevicePixelRatio(dpr); pixmap.fill(Qt.GlobalColor.transparent)
+            p = QPainter(pixmap); p.setRenderHint(QPainter.RenderHint.Antialiasing); self.render_state(p, *state); p.end()
+            self.sprites[key] = pixmap; self.sprite_renders += 1
+        return pixmap
     def paintEvent(self, event):
-        if not config.get("mouse_halo_enabled"): return
-        p = QPainter(self); p.setRenderHint(QPainter.RenderHint.Antialiasing)
+        if not self.enabled: return
+        QPainter(self).drawPixmap(0, 0, self.sprite(self.state()))
+    def render_state(self, p, left_pressed, right_pressed, scroll, middle_pressed):
         cx = self.width() // 2; cy = self.height() // 2; r = self.size_val
         p.setPen(Qt.PenStyle.NoPen); p.setBrush(self.base_color); p.drawEllipse(QPoint(cx, cy), r, r)
-        if self.left_pressed: p.setBrush(self.l_color); p.drawPie(QRect(cx - r, cy - r, r*2, r*2), 90 * 16, 180 * 16)
-        if self.right_pressed: p.setBrush(self.r_color); p.drawPie(QRect(cx - r, cy - r, r*2, r*2), 270 * 16, 180 * 16)
-        if self.scroll_dy != 0:
+        if left_pressed: p.setBrush(self.l_color); p.drawPie(QRect(cx - r, cy - r, r*2, r*2), 90 * 16, 180 * 16)
+        if right_pressed: p.setBrush(self.r_color); p.drawPie(QRect(cx - r, cy - r, r*2, r*2), 270 * 16, 180 * 16)
+        if scroll != 0:
             p.setBrush(self.s_arrow_color); arrow_s = int(self.s_arrow_size * self.symbol_scale)
-            if self.scroll_dy > 0: p1=QPoint(cx,cy-arrow_s); p2=QPoint(cx-int(arrow_s/1.5),cy+int(arrow_s/2)); p3=QPoint(cx+int(arrow_s/1.5),cy+int(arrow_s/2))
+            if scroll > 0: p1=QPoint(cx,cy-arrow_s); p2=QPoint(cx-int(arrow_s/1.5),cy+int(arrow_s/2)); p3=QPoint(cx+int(arrow_s/1.5),cy+int(arrow_s/2))
             else: p1=QPoint(cx,cy+arrow_s); p2=QPoint(cx-int(arrow_s/1.5),cy-int(arrow_s/2)); p3=QPoint(cx+int(arrow_s/1.5),cy-int(arrow_s/2))
             p.drawPolygon(QPolygon([p1, p2, p3]))
-        elif self.middle_pressed:
+        elif middle_pressed:
             p.setBrush(self.m_color); box_s = int(self.middle_sq_size * self.symbol_scale); h = box_s // 2; p.drawRect(cx - h, cy - h, box_s, box_s)
 
 # --- カスタムツリーウィジェット ---
@@ -1948,6 +3413,128 @@ class SettingsDialog(QDialog):
         if ok:
             config.set(f"{prefix}font_family", font.family()); config.set(f"{prefix}font_size", font.pointSize()); config.set(f"{prefix}font_bold", font.bold()); config.set(f"{prefix}font_italic", font.italic()); config.set(f"{prefix}font_underline", font.underline()); config.set(f"{prefix}font_strikeout", font.strikeOut())
 
+# --- ベンチマーク (合成入力によるスループット計測) ---
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024 # macOSはbytes, LinuxはKB
+    except ImportError: pass
+    try:
+        import ctypes
+        from ctypes import wintypes
+        class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD), ("PeakWorkingSetSize", ctypes.c_size_t),
+                        ("WorkingSetSize", ctypes.c_size_t), ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+        counters = PROCESS_MEMORY_COUNTERS(); counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb): return counters.PeakWorkingSetSize / (1024 * 1024)
+    except Exception: pass
+    return None
+
+BENCH_MAX_STACK = 10 # 計測時のログ最大表示数の既定値 (普段使いで画面に積まれる程度)
+
+def _percentile(sorted_values, ratio):
+    if not sorted_values: return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * ratio))]
+
+def build_benchmark_script(backend):
+    # 文字入力・ショートカット・クリック・スクロールを混ぜた1サイクル分の操作
+    steps = []
+    for ch in "keyguide":
+        k = make_synthetic_key(vk=ord(ch.upper()), char=ord(ch)); steps += [(backend.press, (k,)), (backend.release, (k,))]
+    ctrl = make_synthetic_key("ctrl_l"); c_key = make_synthetic_key(vk=ord("C"), char=ord("c"))
+    steps += [(backend.press, (ctrl,)), (backend.press, (c_key,)), (backend.release, (c_key,)), (backend.release, (ctrl,))]
+    right = make_synthetic_button("right")
+    steps += [(backend.click, (100, 100, right, True)), (backend.click, (100, 100, right, False))]
+    steps += [(backend.scroll, (100, 100, 0, -1))] * 4
+    return steps
+
+def run_benchmark_rate(app, worker, overlay, rate, seconds):
+    steps = build_benchmark_script(worker.backend); total = max(1, int(rate * seconds))
+    add_key_times = []; live_peak = [0]; hook_time = [0.0]; done = threading.Event(); latency.clear()
+    worker.rate_governor.reset(); merged_before = worker.rate_governor.merged_total
+    original_add_key = overlay.add_key
+    def timed_add_key(*a, **kw):
+        t = time.perf_counter(); original_add_key(*a, **kw); add_key_times.append(time.perf_counter() - t)
+    overlay.add_key = timed_add_key
+    def produce():
+        start = time.perf_counter(); interval = 1.0 / rate
+        for i in range(total):
+            target = start + i * interval; delay = target - time.perf_counter()
+            if delay > 0.001: time.sleep(delay)
+            func, func_args = steps[i % len(steps)]
+            t = time.perf_counter(); func(*func_args); hook_time[0] += time.perf_counter() - t
+        done.set()
+    loop = QEventLoop(); sampler = QTimer(); sampler.setInterval(20); last_drain = [time.perf_counter()]
+    worker.log_batch_signal.connect(lambda b: last_drain.__setitem__(0, time.perf_counter()))
+    def sample():
+        live_peak[0] = max(live_peak[0], len(overlay.items) if overlay.painted else len(overlay.findChildren(KeyItem)))
+        if done.is_set() and not worker.event_ring.buffer and not worker.drain_timer.isActive(): loop.quit()
+    sampler.timeout.connect(sample)
+    producer = threading.Thread(target=produce, name="KeyGuideBenchmark", daemon=True)
+    start = time.perf_counter(); sampler.start(); producer.start(); loop.exec(); sampler.stop()
+    end = max(last_drain[0], start + 1e-9)
+    overlay.add_key = original_add_key; worker.log_batch_signal.disconnect()
+    worker.log_batch_signal.connect(overlay.add_batch)
+    for item in overlay.items: overlay._remove_item(item)
+    overlay.items = []; app.processEvents()
+    add_key_times.sort()
+    return {"target_rate": rate, "events": total, "sustained_events_per_sec": round(total / (end - start), 1),
+            "hook_us_mean": round(hook_time[0] / total * 1e6, 2),
+            "add_key_calls": len(add_key_times), "add_key_us_mean": round(sum(add_key_times) / max(1, len(add_key_times)) * 1e6, 1),
+            "add_key_us_p95": round(_percentile(add_key_times, 0.95) * 1e6, 1),
+            "live_keyitems_peak": live_peak[0], "storm_merged_events": worker.rate_governor.merged_total - merged_before, "dropped_events": worker.event_ring.dropped, "peak_rss_mb": peak_rss_mb(),
+            "text_cache": text_cache.stats(), "latency": latency.snapshot()}
+
+def measure_idle_wakeups(app, seconds, settle_seconds=5.0):
+    # 表示が消えて定期タイマーが止まり、入力後の単発タイマー (Haloのスクロール表示等) も済んで1秒静かになってから数える
+    now = time.perf_counter(); deadline = now + settle_seconds; last = idle.wakeups; quiet_since = now
+    while now < deadline:
+        app.processEvents(QEventLoop.ProcessEventsFlag.WaitForMoreEvents, 50); now = time.perf_counter()
+        if idle.wakeups != last: last = idle.wakeups; quiet_since = now
+        elif idle.parked and not frame_clock.due and now - quiet_since >= 1.0: break
+    before = idle.wakeups; loop = QEventLoop(); QTimer.singleShot(int(seconds * 1000), loop.quit); loop.exec()
+    return {"seconds": seconds, "wakeups": idle.wakeups - before, "wakeups_per_sec": round((idle.wakeups - before) / seconds, 2), "parked": idle.parked, "frame_clock": frame_clock.stats()}
+
+def run_benchmark(app, args):
+    # offscreenプラグインの「未対応」警告で結果が埋もれないようにする
+    qInstallMessageHandler(lambda mode, ctx, msg: None if msg.startswith("This plugin does not support") else print(msg, file=sys.stderr))
+    if args.bench_config: config.init_paths(); config.load()
+    if args.bench_renderer: config.data["log_renderer"] = args.bench_renderer
+    # 既定の max_stack=1 では表示中の項目が常に1つになり、ログ表示の規模による負荷が測れない
+    if args.bench_max_stack is not None: config.data["max_stack"] = args.bench_max_stack
+    elif not args.bench_config: config.data["max_stack"] = BENCH_MAX_STACK
+    print(f"renderer={config.get('log_renderer')}  max_stack={config.get('max_stack')}")
+    overlay = OverlayWindow(); overlay.show()
+    halo = MouseHalo()
+    worker = InputWorker()
+    worker.log_batch_signal.connect(overlay.add_batch)
+    worker.halo_click_signal.connect(halo.set_click)
+    worker.halo_scroll_signal.connect(halo.set_scroll)
+    worker.halo_move_signal.connect(halo.follow_cursor)
+    clean_timer = QTimer(); clean_timer.timeout.connect(overlay.clean_up); idle.add_timer(clean_timer, 100, lambda: bool(overlay.items))
+    worker.start_listening(SyntheticBackend())
+    latency.enabled = True
+    rates = [int(r) for r in args.bench_rates.split(",") if r.strip()]
+    results = []
+    for rate in rates:
+        result = run_benchmark_rate(app, worker, overlay, rate, args.bench_seconds); results.append(result)
+        print(f"[{rate:>6} ev/s] sustained={result['sustained_events_per_sec']:>9} ev/s  hook={result['hook_us_mean']:>7} us  "
+              f"add_key={result['add_key_us_mean']:>8} us (p95 {result['add_key_us_p95']})  live KeyItem peak={result['live_keyitems_peak']}  storm merged={result['storm_merged_events']}  "
+              f"peak RSS={result['peak_rss_mb'] and round(result['peak_rss_mb'], 1)} MB")
+    # 普段のタイピング程度 (100 ev/s 以下) でストームにまとめられていたら誤検知として失敗扱いにする
+    false_storms = [r["target_rate"] for r in results if r["target_rate"] <= 100 and r["storm_merged_events"]]
+    if false_storms: print(f"FAIL: input storm triggered at normal input rates: {false_storms}", file=sys.stderr)
+    idle_result = measure_idle_wakeups(app, args.bench_idle_seconds); results.append({"idle": idle_result})
+    print(f"[  idle   ] wakeups={idle_result['wakeups_per_sec']}/s over {idle_result['seconds']} s  (timers parked={idle_result['parked']})")
+    worker.stop_listening()
+    if args.bench_output:
+        with open(args.bench_output, 'w', encoding='utf-8') as f: json.dump(results, f, indent=4)
+    return 1 if false_storms else 0
+
 # --- Logging Setup ---
 def setup_logging():
     log_file = config.config_dir / "debug.log"
@@ -1965,7 +3552,25 @@ def setup_logging():
     sys.excepthook = excepthook
 
 # --- Main App ---
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="417_KeyGuide")
+    parser.add_argument("--replay", nargs="+", metavar="PATH", help="記録したジャーナル (.kgj ファイルまたはフォルダ) を再生する")
+    parser.add_argument("--replay-speed", type=float, default=1.0, help="再生速度の倍率 (0 で待ち時間なしの最速再生)")
+    parser.add_argument("--trace-latency", action="store_true", help="入力から描画までのレイテンシを計測する (設定 latency_trace_enabled と同じ)")
+    parser.add_argument("--dump-latency", action="store_true", help="起動中のアプリにレイテンシ統計を config/latency.json へ書き出させる")
+    parser.add_argument("--benchmark", action="store_true", help="合成入力で入力処理とログ表示のスループットを計測する (offscreen)")
+    parser.add_argument("--bench-rates", default="100,1000,10000", help="計測する入力レート (events/s, カンマ区切り)")
+    parser.add_argument("--bench-seconds", type=float, default=3.0, help="各レートの計測時間 (秒)")
+    parser.add_argument("--bench-config", action="store_true", help="既定値ではなくユーザー設定・ショートカットを読み込んで計測する")
+    parser.add_argument("--bench-idle-seconds", type=float, default=2.0, help="入力停止後にアイドル時のウェイクアップ数を数える時間 (秒)")
+    parser.add_argument("--bench-max-stack", type=int, metavar="N", help=f"計測時のログ最大表示数 (省略時は {BENCH_MAX_STACK}、--bench-config 指定時は設定 max_stack)")
+    parser.add_argument("--bench-renderer", choices=["widgets", "painted"], help="計測するログの描画方式 (省略時は設定 log_renderer)")
+    parser.add_argument("--bench-output", metavar="FILE", help="計測結果をJSONで保存する")
+    args, _ = parser.parse_known_args(argv) # Qt側の引数はそのまま通す
+    return args
+
 def main():
+    args = parse_args(sys.argv[1:])
     QApplication.setHighDpiScaleFactorRoundingPolicy(Qt.HighDpiScaleFactorRoundingPolicy.PassThrough)
     
     app = QApplication(sys.argv)
@@ -1973,22 +3578,30 @@ def main():
     app.setOrganizationName(APP_ORG)
     app.setQuitOnLastWindowClosed(False)
 
-    socket = QLocalSocket()
-    socket.connectToServer(IPC_KEY)
-    
-    if socket.waitForConnected(500):
-        socket.write(b"SHOW_SETTINGS")
-        socket.waitForBytesWritten(1000)
-        socket.disconnectFromServer()
-        sys.exit(0)
+    if args.benchmark: sys.exit(run_benchmark(app, args))
+
+    # リプレイ時は常駐中のインスタンスとは独立して起動する
+    if not args.replay:
+        socket = QLocalSocket()
+        socket.connectToServer(IPC_KEY)
+        
+        if socket.waitForConnected(500):
+            socket.write(b"DUMP_LATENCY" if args.dump_latency else b"SHOW_SETTINGS")
+            socket.waitForBytesWritten(1000)
+            socket.disconnectFromServer()
+            sys.exit(0)
 
     config.init_paths()
     setup_logging()
     config.load()
+    config.read_only = bool(args.replay) # リプレイは利用者の設定・ジャーナルに何も書き残さない
+    latency.enabled = bool(config.get("latency_trace_enabled")) or args.trace_latency
+    latency_path = config.config_dir / "latency.json"
     
-    QLocalServer.removeServer(IPC_KEY)
     server = QLocalServer()
-    server.listen(IPC_KEY)
+    if not args.replay:
+        QLocalServer.removeServer(IPC_KEY)
+        server.listen(IPC_KEY)
     
     app_icon_path = config.get_app_icon_path()
     app_icon = QIcon(app_icon_path) if app_icon_path else None
@@ -2007,17 +3620,17 @@ def main():
     if app_icon: cs_window.setWindowIcon(app_icon)
     cs_overlay = CheatSheetOverlay()
     
-    worker = InputWorker()
-    worker.key_signal.connect(overlay.add_key)
-    worker.hold_signal.connect(overlay.maintain_key)
-    worker.mouse_signal.connect(lambda t, m: overlay.add_key(t, is_mod_pressed=m))
+    worker = InputWorker(record_journal=not args.replay)
+    worker.log_batch_signal.connect(overlay.add_batch)
+    worker.hold_release_signal.connect(overlay.release_hold)
     worker.halo_click_signal.connect(halo.set_click)
     worker.halo_scroll_signal.connect(halo.set_scroll)
     
-    # マウス移動はMouseHalo内のタイマーで行うためシグナル接続不要
+    worker.halo_move_signal.connect(halo.follow_cursor)
     
     worker.cheat_window_signal.connect(cs_window.toggle_visibility)
     worker.cheat_overlay_signal.connect(cs_overlay.show_overlay)
+    worker.cheat_overlay_signal.connect(halo.restack) # チートシートが前面に出たら Halo を上に戻す
 
     settings_dialog = None
     def show_settings():
@@ -2035,6 +3648,8 @@ def main():
             msg = client_socket.readAll().data()
             if msg == b"SHOW_SETTINGS":
                 show_settings()
+            elif msg == b"DUMP_LATENCY":
+                latency.dump(latency_path, {"idle": idle.stats(), "frame_clock": frame_clock.stats()})
         client_socket.disconnectFromServer()
     
     server.newConnection.connect(handle_new_connection)
@@ -2064,8 +3679,11 @@ def main():
     
     # --- 終了処理 ---
     def quit_app():
-        config.force_save()     # 未保存があれば保存
+        if not replayer: config.force_save() # 未保存があれば保存 (リプレイ中は書かない)
+        if replayer: replayer.stop()
+        if capture: capture.stop()
         worker.stop_listening() # リスナー停止
+        if latency.enabled: latency.dump(latency_path)
         
         if tray.isVisible():
             tray.setVisible(False) # 幽霊アイコン対策
@@ -2088,17 +3706,36 @@ def main():
         action_settings.setText(config.tr("ui.tray.settings", "設定"))
         action_exit.setText(config.tr("ui.tray.exit", "アプリの終了"))
 
+    def sync_latency_trace(key, val):
+        if key == "latency_trace_enabled": latency.enabled = bool(val) or args.trace_latency
+
     config.changed_signal.connect(sync_tray_menu)
+    config.changed_signal.connect(sync_latency_trace)
     config.language_changed_signal.connect(refresh_tray_menu)
 
+    replayer = None
+    if args.replay:
+        records = InputReplayer.load_records(args.replay)
+        replayer = InputReplayer(worker, records, args.replay_speed)
+        halo.cursor_source = worker.pointer_point # 実際のカーソルではなく記録された座標を追う
+        replayer.finished_signal.connect(lambda n: logging.info(f"Replay finished: {n} events"))
+
+    capture = None
+    if replayer is None and config.get("capture_mode") == "process":
+        try: capture = CaptureProcess(worker, config.get("capture_ring_records"), config.get("input_backend")); capture.start()
+        except Exception as e: logging.error(f"Failed to start capture process, falling back to in-process hooks: {e}"); capture = None
+
     tray.setVisible(True)
-    worker.start_listening()
+    config.watch_foreground()
+    worker.start_listening(SyntheticBackend() if replayer or capture else None)
     clean_timer = QTimer()
     clean_timer.timeout.connect(overlay.clean_up)
-    clean_timer.start(100)
+    idle.add_timer(clean_timer, 100, lambda: bool(overlay.items)) # ログが空になったら止め、次の入力で再開する
 
-    show_settings()
+    if replayer: replayer.start()
+    else: show_settings()
     sys.exit(app.exec())
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # exe化した場合に子プロセスとして起動された時の処理
     main()